@@ -507,6 +507,12 @@ os.makedirs(TEST_DATA_ROOT, exist_ok=True)
 EXPORT_DIR = os.path.join(BASE_DATA_DIR, 'export')
 EXPORT_URL_ROOT = '/export/'
 EXPORT_MIXIN = 'data_export.mixins.ExportMixin'
+# threads serializing export batches while next batches are fetched, 0 serializes in the export job thread
+EXPORT_SERIALIZATION_WORKERS = int(get_env('EXPORT_SERIALIZATION_WORKERS', 0))
+# build JSON export from .values() rows instead of DRF serializers when export options allow it
+EXPORT_RAW_SERIALIZATION = get_bool_env('EXPORT_RAW_SERIALIZATION', True)
+# background export job retries, each retry resumes the export from its last written chunk
+EXPORT_JOB_RETRIES = int(get_env('EXPORT_JOB_RETRIES', 3))
 # old export dir
 os.makedirs(EXPORT_DIR, exist_ok=True)
 # dir for delayed export
@@ -517,13 +523,21 @@ os.makedirs(os.path.join(BASE_DATA_DIR, MEDIA_ROOT, DELAYED_EXPORT_DIR), exist_o
 DATA_UPLOAD_MAX_MEMORY_SIZE = int(get_env('DATA_UPLOAD_MAX_MEMORY_SIZE', 250 * 1024 * 1024))
 DATA_UPLOAD_MAX_NUMBER_FILES = int(get_env('DATA_UPLOAD_MAX_NUMBER_FILES', 100))
 TASKS_MAX_NUMBER = 1000000
+# async import of uploaded files parses, validates and saves tasks in chunks of this size, 0 loads all tasks at once
+IMPORT_STREAMING_CHUNK_SIZE = int(get_env('IMPORT_STREAMING_CHUNK_SIZE', 0))
 TASKS_MAX_FILE_SIZE = DATA_UPLOAD_MAX_MEMORY_SIZE
 
 TASK_LOCK_TTL = int(get_env('TASK_LOCK_TTL', default=86400))
+# where task locks are stored: 'database' (TaskLock table) or 'redis' (falls back to database if redis is not connected)
+TASK_LOCK_BACKEND = get_env('TASK_LOCK_BACKEND', default='database')
 
 LABEL_STREAM_HISTORY_LIMIT = int(get_env('LABEL_STREAM_HISTORY_LIMIT', default=100))
 
 RANDOM_NEXT_TASK_SAMPLE_SIZE = int(get_env('RANDOM_NEXT_TASK_SAMPLE_SIZE', 50))
+# select next task candidates with lock and overlap checks computed in SQL instead of probing tasks one by one
+NEXT_TASK_SINGLE_QUERY_ENABLED = get_bool_env('NEXT_TASK_SINGLE_QUERY_ENABLED', True)
+# use precomputed task stream state columns instead of counting annotations, run `rebuild_task_stream_state` first
+NEXT_TASK_USE_STREAM_STATE = get_bool_env('NEXT_TASK_USE_STREAM_STATE', False)
 
 TASK_API_PAGE_SIZE_MAX = int(get_env('TASK_API_PAGE_SIZE_MAX', 0)) or None
 
@@ -683,6 +697,12 @@ FUTURE_SAVE_TASK_TO_STORAGE = get_bool_env('FUTURE_SAVE_TASK_TO_STORAGE', defaul
 FUTURE_SAVE_TASK_TO_STORAGE_JSON_EXT = get_bool_env('FUTURE_SAVE_TASK_TO_STORAGE_JSON_EXT', default=True)
 STORAGE_IN_PROGRESS_TIMER = float(get_env('STORAGE_IN_PROGRESS_TIMER', 5.0))
 STORAGE_EXPORT_CHUNK_SIZE = int(get_env('STORAGE_EXPORT_CHUNK_SIZE', 100))
+# number of storage objects imported with bulk writes, 0 creates tasks one by one
+STORAGE_IMPORT_BATCH_SIZE = int(get_env('STORAGE_IMPORT_BATCH_SIZE', 0))
+# number of storage keys checked for existing links with one query during sync
+STORAGE_SYNC_KEYS_CHUNK_SIZE = int(get_env('STORAGE_SYNC_KEYS_CHUNK_SIZE', 500))
+# number of threads fetching and parsing storage objects ahead of task creation during sync
+STORAGE_IMPORT_FETCH_WORKERS = int(get_env('STORAGE_IMPORT_FETCH_WORKERS', 1))
 
 USE_NGINX_FOR_EXPORT_DOWNLOADS = get_bool_env('USE_NGINX_FOR_EXPORT_DOWNLOADS', False)
 USE_NGINX_FOR_UPLOADS = get_bool_env('USE_NGINX_FOR_UPLOADS', True)
@@ -0,0 +1,4 @@
+info = {"message": "[user-010] Write exports in resumable chunks with a task id checkpoint", "commit": "51f82c433a744ba7931389a1aa3f7770797d3c98", "date": "2026/10/18 22:11:37", "branch": "", "version": "51f82c4+dirty"}
+
+# This file is automatically generated by version.py
+# Do not include it to git!
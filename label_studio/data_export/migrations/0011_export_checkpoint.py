@@ -0,0 +1,23 @@
+# Generated by Django 5.1.10 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_export', '0010_alter_convertedformat_export_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='checkpoint_task_id',
+            field=models.BigIntegerField(default=None, help_text='Last task id written to export chunks, interrupted export is resumed after it', null=True, verbose_name='checkpoint task id'),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='chunks',
+            field=models.IntegerField(default=0, help_text='Number of export chunks written before the checkpoint', verbose_name='chunks'),
+        ),
+    ]
@@ -5,14 +5,16 @@ import logging
 import os
 import pathlib
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import reduce
 
 import django_rq
+import ujson
 from core.redis import redis_connected
 from core.utils.common import batch
 from core.utils.io import (
-    SerializableGenerator,
     get_all_dirs_from_dir,
     get_all_files_from_dir,
     get_temp_dir,
@@ -21,11 +23,13 @@ from data_manager.models import View
 from django.conf import settings
 from django.core.files import File
 from django.core.files import temp as tempfile
-from django.db import transaction
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
 from django.db.models import Prefetch
 from django.db.models.query_utils import Q
 from django.utils import dateformat, timezone
 from label_studio_sdk.converter import Converter
+from rq import Retry
 from tasks.models import Annotation, AnnotationDraft, Task
 
 ONLY = 'only'
@@ -160,10 +164,88 @@ class ExportMixin:
             .prefetch_related(
                 Prefetch('annotations', queryset=annotations_qs),
                 Prefetch('drafts', queryset=AnnotationDraft.objects.select_related('user')),
+                'predictions',
                 'comment_authors',
             )
         )
 
+    def _get_export_task_ids(self, task_filter_options=None):
+        logger.debug('Tasks filtration')
+        return (
+            self._get_filtered_tasks(self.project.tasks, task_filter_options=task_filter_options)
+            .distinct()
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def _iter_task_batches(
+        self, task_ids, task_filter_options=None, annotation_filter_options=None, serialization_options=None
+    ):
+        """Batches of task ids with their tasks to export and serializer options
+
+        Batches exported by raw export are lists of task dicts with None instead of serializer options.
+        """
+        from .raw_export import export_tasks_raw, is_raw_export_supported
+
+        base_export_serializer_option = self._get_export_serializer_option(serialization_options)
+        include_annotation_history = bool(
+            serialization_options and serialization_options.get('include_annotation_history') is True
+        )
+        only_with_annotations = isinstance(task_filter_options, dict) and task_filter_options.get(
+            'only_with_annotations'
+        )
+        raw = not include_annotation_history and is_raw_export_supported(base_export_serializer_option)
+        i = 0
+        BATCH_SIZE = 1000
+        for ids in batch(task_ids, BATCH_SIZE):
+            i += 1
+            logger.debug(f'Batch: {i*BATCH_SIZE}')
+            if raw:
+                annotations = self._get_filtered_annotations_queryset(annotation_filter_options)
+                tasks = export_tasks_raw(
+                    Task.objects.filter(id__in=ids), annotations, self.project, base_export_serializer_option
+                )
+                if only_with_annotations:
+                    tasks = [task for task in tasks if task['annotations']]
+                yield ids, tasks, None
+                continue
+
+            tasks = list(self.get_task_queryset(ids, annotation_filter_options))
+            if only_with_annotations:
+                tasks = [task for task in tasks if task.annotations.exists()]
+
+            if include_annotation_history:
+                annotation_ids = Annotation.objects.filter(task_id__in=[task.id for task in tasks]).values_list(
+                    'id', flat=True
+                )
+                base_export_serializer_option = self.update_export_serializer_option(
+                    base_export_serializer_option, annotation_ids
+                )
+
+            yield ids, tasks, base_export_serializer_option
+
+    def _iter_export_batches(
+        self, task_filter_options=None, annotation_filter_options=None, serialization_options=None
+    ):
+        """Batches of tasks to export with their serializer options, see get_export_data and _iter_task_batches"""
+        logger.debug('Run get_task_queryset')
+
+        start = datetime.now()
+        with transaction.atomic():
+            # TODO: make counters from queryset
+            # counters = Project.objects.with_counts().filter(id=self.project.id)[0].get_counters()
+            self.counters = {'task_number': 0}
+            task_ids = self._get_export_task_ids(task_filter_options)
+            for _, tasks, export_serializer_option in self._iter_task_batches(
+                task_ids, task_filter_options, annotation_filter_options, serialization_options
+            ):
+                self.counters['task_number'] += len(tasks)
+                yield tasks, export_serializer_option
+        duration = datetime.now() - start
+        logger.info(
+            f'{self.counters["task_number"]} tasks from project {self.project_id} exported in {duration.total_seconds():.2f} seconds'
+        )
+
     def get_export_data(self, task_filter_options=None, annotation_filter_options=None, serialization_options=None):
         """
         serialization_options: None or Dict({
@@ -187,48 +269,140 @@ class ExportMixin:
                 })
         })
         """
+        for tasks, export_serializer_option in self._iter_export_batches(
+            task_filter_options=task_filter_options,
+            annotation_filter_options=annotation_filter_options,
+            serialization_options=serialization_options,
+        ):
+            for task in self._get_tasks_data(tasks, export_serializer_option):
+                yield task
+
+    @staticmethod
+    def _get_tasks_data(tasks, export_serializer_option):
+        if export_serializer_option is None:
+            # already exported by raw export
+            return tasks
+
         from .serializers import ExportDataSerializer
 
-        logger.debug('Run get_task_queryset')
+        return ExportDataSerializer(tasks, many=True, **export_serializer_option).data
+
+    @staticmethod
+    def _encode_tasks(tasks_data):
+        """Serialized tasks as comma separated JSON objects, ujson for plain data with json fallback"""
+        chunks = []
+        for task in tasks_data:
+            try:
+                chunks.append(ujson.dumps(task, ensure_ascii=False, escape_forward_slashes=False))
+            except (TypeError, ValueError, OverflowError):
+                chunks.append(json.dumps(task, ensure_ascii=False))
+        return ', '.join(chunks)
 
+    def _serialize_batch(self, tasks, export_serializer_option):
+        return self._encode_tasks(self._get_tasks_data(tasks, export_serializer_option))
+
+    def _serialize_batch_in_thread(self, tasks, export_serializer_option):
+        try:
+            return self._serialize_batch(tasks, export_serializer_option)
+        finally:
+            # worker threads open their own database connections
+            connections.close_all()
+
+    def _iter_serialized_batches(self, batches):
+        """Encoded batches in export order
+
+        With EXPORT_SERIALIZATION_WORKERS > 0 batches are serialized by a thread pool while next batches are fetched,
+        at most workers + 1 batches are kept in memory.
+        """
+        workers = settings.EXPORT_SERIALIZATION_WORKERS
+        if workers <= 0:
+            for tasks, export_serializer_option in batches:
+                yield self._serialize_batch(tasks, export_serializer_option)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = deque()
+            for tasks, export_serializer_option in batches:
+                futures.append(executor.submit(self._serialize_batch_in_thread, tasks, export_serializer_option))
+                if len(futures) > workers:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
+    def _get_chunk_name(self, number):
+        return f'{settings.DELAYED_EXPORT_DIR}/{self.project_id}/export-{self.id}-chunk-{number:06}.json'
+
+    def _write_chunks(self, task_filter_options=None, annotation_filter_options=None, serialization_options=None):
+        """Write tasks to numbered chunk files with comma separated JSON objects
+
+        The last written task id is saved as checkpoint after each chunk, an interrupted export continues after it.
+        """
         start = datetime.now()
-        with transaction.atomic():
-            # TODO: make counters from queryset
-            # counters = Project.objects.with_counts().filter(id=self.project.id)[0].get_counters()
+        task_ids = self._get_export_task_ids(task_filter_options)
+        if self.checkpoint_task_id is None:
             self.counters = {'task_number': 0}
-            all_tasks = self.project.tasks
-            logger.debug('Tasks filtration')
-            task_ids = (
-                self._get_filtered_tasks(all_tasks, task_filter_options=task_filter_options)
-                .distinct()
-                .values_list('id', flat=True)
-            )
-            base_export_serializer_option = self._get_export_serializer_option(serialization_options)
-            i = 0
-            BATCH_SIZE = 1000
-            for ids in batch(task_ids, BATCH_SIZE):
-                i += 1
-                tasks = list(self.get_task_queryset(ids, annotation_filter_options))
-                logger.debug(f'Batch: {i*BATCH_SIZE}')
-                if isinstance(task_filter_options, dict) and task_filter_options.get('only_with_annotations'):
-                    tasks = [task for task in tasks if task.annotations.exists()]
-
-                if serialization_options and serialization_options.get('include_annotation_history') is True:
-                    task_ids = [task.id for task in tasks]
-                    annotation_ids = Annotation.objects.filter(task_id__in=task_ids).values_list('id', flat=True)
-                    base_export_serializer_option = self.update_export_serializer_option(
-                        base_export_serializer_option, annotation_ids
-                    )
-
-                serializer = ExportDataSerializer(tasks, many=True, **base_export_serializer_option)
-                self.counters['task_number'] += len(tasks)
-                for task in serializer.data:
-                    yield task
+        else:
+            logger.info(f'Resume export {self.id} after task {self.checkpoint_task_id} with {self.chunks} chunks')
+            task_ids = task_ids.filter(id__gt=self.checkpoint_task_id)
+
+        # last task id and number of tasks of batches that are serialized and not written yet
+        pending = deque()
+
+        def iter_batches():
+            for ids, tasks, export_serializer_option in self._iter_task_batches(
+                task_ids, task_filter_options, annotation_filter_options, serialization_options
+            ):
+                pending.append((ids[-1], len(tasks)))
+                yield tasks, export_serializer_option
+
+        storage = self.file.storage
+        for chunk in self._iter_serialized_batches(iter_batches()):
+            last_task_id, task_number = pending.popleft()
+            if chunk:
+                name = self._get_chunk_name(self.chunks)
+                # chunk written by an interrupted run before its checkpoint was saved
+                if storage.exists(name):
+                    storage.delete(name)
+                storage.save(name, ContentFile(chunk.encode('utf-8')))
+                self.chunks += 1
+            self.checkpoint_task_id = last_task_id
+            self.counters['task_number'] += task_number
+            self.save(update_fields=['checkpoint_task_id', 'chunks', 'counters'])
+
         duration = datetime.now() - start
         logger.info(
-            f'{self.counters["task_number"]} tasks from project {self.project_id} exported in {duration.total_seconds():.2f} seconds'
+            f'{self.counters["task_number"]} tasks from project {self.project_id} exported to {self.chunks} chunks '
+            f'in {duration.total_seconds():.2f} seconds'
         )
 
+    def _assemble_chunks(self, file):
+        """Write JSON array of all chunks to file and return its md5"""
+        storage = self.file.storage
+        md5_object = hashlib.md5()   # nosec
+        block_size = 128 * md5_object.block_size
+
+        def write(data):
+            md5_object.update(data)
+            file.write(data)
+
+        write(b'[')
+        for number in range(self.chunks):
+            if number:
+                write(b', ')
+            with storage.open(self._get_chunk_name(number), 'rb') as chunk:
+                for data in iter(lambda: chunk.read(block_size), b''):
+                    write(data)
+        write(b']')
+        return md5_object.hexdigest()
+
+    def _delete_chunks(self):
+        storage = self.file.storage
+        for number in range(self.chunks):
+            storage.delete(self._get_chunk_name(number))
+        self.checkpoint_task_id = None
+        self.chunks = 0
+        self.save(update_fields=['checkpoint_task_id', 'chunks'])
+
     def update_export_serializer_option(self, base_export_serializer_option, annotation_ids):
         return base_export_serializer_option
 
@@ -252,7 +426,18 @@ class ExportMixin:
         self.md5 = md5
         self.save(update_fields=['file', 'md5', 'counters'])
 
-    def export_to_file(self, task_filter_options=None, annotation_filter_options=None, serialization_options=None):
+    def export_to_file(
+        self,
+        task_filter_options=None,
+        annotation_filter_options=None,
+        serialization_options=None,
+        raise_exception=False,
+    ):
+        """Export tasks to chunks and assemble them into the export file
+
+        Export interrupted by an error continues from its checkpoint on the next run.
+        raise_exception: raise errors instead of marking the export as failed, used by retried background jobs
+        """
         logger.debug(
             f'Run export for {self.id} with params:\n'
             f'task_filter_options: {task_filter_options}\n'
@@ -260,31 +445,26 @@ class ExportMixin:
             f'serialization_options: {serialization_options}\n'
         )
         try:
-            iter_json = json.JSONEncoder(ensure_ascii=False).iterencode(
-                SerializableGenerator(
-                    self.get_export_data(
-                        task_filter_options=task_filter_options,
-                        annotation_filter_options=annotation_filter_options,
-                        serialization_options=serialization_options,
-                    )
-                )
+            self._write_chunks(
+                task_filter_options=task_filter_options,
+                annotation_filter_options=annotation_filter_options,
+                serialization_options=serialization_options,
             )
             with tempfile.NamedTemporaryFile(suffix='.export.json', dir=settings.FILE_UPLOAD_TEMP_DIR) as file:
-                for chunk in iter_json:
-                    encoded_chunk = chunk.encode('utf-8')
-                    file.write(encoded_chunk)
+                md5 = self._assemble_chunks(file)
                 file.seek(0)
-
-                md5 = self.eval_md5(file)
                 self.save_file(file, md5)
+            self._delete_chunks()
 
             self.status = self.Status.COMPLETED
             self.save(update_fields=['status'])
 
         except Exception as e:
+            logger.exception('Export was failed: %s', e)
+            if raise_exception:
+                raise
             self.status = self.Status.FAILED
             self.save(update_fields=['status'])
-            logger.exception('Export was failed: %s', e)
         finally:
             self.finished_at = datetime.now()
             self.save(update_fields=['finished_at'])
@@ -307,6 +487,8 @@ class ExportMixin:
                 serialization_options,
                 on_failure=set_export_background_failure,
                 job_timeout='3h',  # 3 hours
+                # retried jobs resume the export from its checkpoint
+                retry=Retry(max=settings.EXPORT_JOB_RETRIES) if settings.EXPORT_JOB_RETRIES > 0 else None,
             )
         else:
             self.export_to_file(
@@ -371,11 +553,15 @@ def export_background(
         task_filter_options,
         annotation_filter_options,
         serialization_options,
+        raise_exception=True,
     )
 
 
 def set_export_background_failure(job, connection, type, value, traceback):
     from data_export.models import Export
 
+    if job.retries_left:
+        # the job is going to be retried
+        return
     export_id = job.args[0]
     Export.objects.filter(id=export_id).update(status=Export.Status.FAILED)
@@ -70,6 +70,17 @@ class Export(ExportMixin, models.Model):
         _('Exporting meta data'),
         default=dict,
     )
+    checkpoint_task_id = models.BigIntegerField(
+        _('checkpoint task id'),
+        help_text='Last task id written to export chunks, interrupted export is resumed after it',
+        null=True,
+        default=None,
+    )
+    chunks = models.IntegerField(
+        _('chunks'),
+        help_text='Number of export chunks written before the checkpoint',
+        default=0,
+    )
     project = models.ForeignKey(
         'projects.Project',
         related_name='exports',
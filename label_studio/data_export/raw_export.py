@@ -0,0 +1,171 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import os
+from collections import defaultdict
+
+from core.label_config import replace_task_data_undefined_with_config_field
+from django.conf import settings
+from django.utils import timezone
+from label_studio_sdk._extensions.label_studio_tools.core.label_config import is_video_object_tracking
+from label_studio_sdk._extensions.label_studio_tools.postprocessing.video import extract_key_frames
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from tasks.models import AnnotationDraft, Prediction, Task
+from users.models import User
+
+from .serializers import BaseExportDataSerializer, CompletedBySerializer, ExportDataSerializer
+
+# expandable fields of BaseExportDataSerializer that raw export can build
+RAW_EXPANDABLE_FIELDS = {'annotations.completed_by'}
+
+
+def _get_datetime_converter():
+    """DRF DateTimeField representation with the current timezone resolved once instead of per value"""
+    field = serializers.DateTimeField()
+    field_timezone = field.default_timezone()
+    if field_timezone is None or (api_settings.DATETIME_FORMAT or '').lower() != ISO_8601:
+        return field.to_representation
+
+    def convert(value):
+        if not value or not timezone.is_aware(value):
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return convert
+
+
+def _get_field_converters():
+    """The same conversions DRF model serializer fields do for model values, by model field type"""
+    return {
+        'DateTimeField': _get_datetime_converter(),
+        'UUIDField': lambda value: None if value is None else str(value),
+        'FloatField': lambda value: None if value is None else float(value),
+    }
+
+
+# marks a field DRF skips for this object
+_SKIP = object()
+
+
+def is_raw_export_supported(export_serializer_option):
+    """Raw export builds the output of the default export serializer only, with drafts and predictions as ids"""
+    return (
+        settings.EXPORT_RAW_SERIALIZATION
+        and ExportDataSerializer is BaseExportDataSerializer
+        and set(export_serializer_option.get('expand', [])) <= RAW_EXPANDABLE_FIELDS
+    )
+
+
+def _get_readers(model, field_names, converters, field_converters):
+    """List of (output key, values() key, converter) for serializer field names,
+    converters: output key => (values() key, converter) for fields that are not plain model fields
+    """
+    readers = []
+    for name in field_names:
+        if name in converters:
+            readers.append((name, *converters[name]))
+        else:
+            field = model._meta.get_field(name)
+            readers.append((name, field.attname, field_converters.get(field.get_internal_type())))
+    return readers
+
+
+def _read(row, readers):
+    item = {}
+    for name, key, converter in readers:
+        value = row[key] if converter is None else converter(row[key])
+        if value is not _SKIP:
+            item[name] = value
+    return item
+
+
+def _values_keys(readers):
+    return list(dict.fromkeys(key for _, key, _ in readers))
+
+
+def _group_ids(rows):
+    """{task_id: [id, ...]} from (task_id, id) rows"""
+    grouped = defaultdict(list)
+    for task_id, id in rows:
+        grouped[task_id].append(id)
+    return grouped
+
+
+def export_tasks_raw(tasks, annotations, project, export_serializer_option):
+    """Same data as ExportDataSerializer(tasks, many=True, **export_serializer_option).data
+
+    Tasks, annotations, predictions, drafts and comment authors are read as `.values()` rows and joined in Python,
+    no model instances and serializer fields are created per task.
+
+    :param tasks: Task queryset to export
+    :param annotations: Annotation queryset with annotations to include into tasks
+    :param project: project of the tasks
+    :param export_serializer_option: expand, omit and context options of the export serializer
+    """
+    # serializer instance gives the output fields in their order with expand and omit applied
+    fields = BaseExportDataSerializer(**export_serializer_option).fields
+    context = export_serializer_option.get('context', {})
+    field_converters = _get_field_converters()
+
+    annotations_by_task = defaultdict(list)
+    related_ids = {name: {} for name in ('drafts', 'predictions', 'comment_authors') if name in fields}
+
+    def replace_undefined(data):
+        replace_task_data_undefined_with_config_field(data, project)
+        return data
+
+    converters = {
+        'annotations': ('id', lambda task_id: annotations_by_task.get(task_id, [])),
+        'file_upload': (
+            'file_upload__file',
+            lambda file_name: _SKIP if file_name is None else os.path.basename(file_name),
+        ),
+        'data': ('data', replace_undefined),
+    }
+    for name in related_ids:
+        converters[name] = ('id', lambda task_id, name=name: related_ids[name].get(task_id, []))
+    task_readers = _get_readers(Task, fields, converters, field_converters)
+    task_rows = list(tasks.prefetch_related(None).values(*_values_keys(task_readers)))
+    task_ids = [row['id'] for row in task_rows]
+
+    if 'annotations' in fields:
+        annotation_fields = fields['annotations'].child.fields
+        users = {}
+        converters = {'result': ('result', None)}
+        if context.get('interpolate_key_frames', False) and is_video_object_tracking(
+            parsed_config=project.get_parsed_config()
+        ):
+            converters['result'] = ('result', lambda result: extract_key_frames(result) if result else result)
+        if isinstance(annotation_fields.get('completed_by'), CompletedBySerializer):
+            converters['completed_by'] = ('completed_by_id', lambda user_id: users.get(user_id))
+        readers = _get_readers(annotations.model, annotation_fields, converters, field_converters)
+
+        annotation_rows = list(
+            annotations.filter(task_id__in=task_ids)
+            .prefetch_related(None)
+            .order_by('id')
+            .values('task_id', *_values_keys(readers))
+        )
+        if 'completed_by' in converters:
+            user_ids = {row['completed_by_id'] for row in annotation_rows}
+            users.update(
+                (user['id'], user)
+                for user in User.objects.filter(id__in=user_ids).values(*CompletedBySerializer.Meta.fields)
+            )
+        for row in annotation_rows:
+            annotations_by_task[row['task_id']].append(_read(row, readers))
+
+    related_querysets = {
+        'drafts': AnnotationDraft.objects.filter(task_id__in=task_ids).values_list('task_id', 'id'),
+        'predictions': Prediction.objects.filter(task_id__in=task_ids).values_list('task_id', 'id'),
+        'comment_authors': Task.comment_authors.through.objects.filter(task_id__in=task_ids).values_list(
+            'task_id', 'user_id'
+        ),
+    }
+    for name in related_ids:
+        related_ids[name] = _group_ids(related_querysets[name].order_by('id'))
+
+    return [_read(row, task_readers) for row in task_rows]
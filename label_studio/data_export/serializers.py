@@ -9,7 +9,7 @@ from label_studio_sdk._extensions.label_studio_tools.postprocessing.video import
 from ml.mixins import InteractiveMixin
 from rest_flex_fields import FlexFieldsModelSerializer
 from rest_framework import serializers
-from tasks.models import Annotation, Task
+from tasks.models import STREAM_STATE_FIELDS, Annotation, Task
 from tasks.serializers import AnnotationDraftSerializer, PredictionSerializer
 from users.models import User
 from users.serializers import UserSimpleSerializer
@@ -69,7 +69,7 @@ class BaseExportDataSerializer(FlexFieldsModelSerializer):
 
     class Meta:
         model = Task
-        exclude = ('overlap', 'is_labeled')
+        exclude = ('overlap', 'is_labeled', *STREAM_STATE_FIELDS)
         expandable_fields = {
             'drafts': (AnnotationDraftSerializer, {'many': True}),
             'predictions': (PredictionSerializer, {'many': True}),
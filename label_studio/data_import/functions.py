@@ -1,12 +1,14 @@
 import logging
 import time
 import traceback
+from itertools import islice
 from typing import Callable, Optional
 
 from core.utils.common import load_func
 from django.conf import settings
 from django.db import transaction
 from projects.models import ProjectImport, ProjectReimport, ProjectSummary
+from rest_framework.exceptions import ValidationError
 from users.models import User
 from webhooks.models import WebhookAction
 from webhooks.utils import emit_webhooks_for_instance
@@ -35,6 +37,13 @@ def async_import_background(
 
     user = User.objects.get(id=user_id)
 
+    if (
+        settings.IMPORT_STREAMING_CHUNK_SIZE > 0
+        and project_import.file_upload_ids
+        and project_import.commit_to_project
+    ):
+        return async_import_chunks(project_import, user, settings.IMPORT_STREAMING_CHUNK_SIZE)
+
     start = time.time()
     project = project_import.project
     tasks = None
@@ -102,6 +111,77 @@ def async_import_background(
     project_import.save()
 
 
+def _import_tasks_chunk(project, user, tasks):
+    """Validate and save one chunk of tasks with project counters and summary updates, see async_import_background"""
+    with transaction.atomic():
+        # Lock summary for update to avoid race conditions
+        summary = ProjectSummary.objects.select_for_update().get(project=project)
+
+        serializer = ImportApiSerializer(data=tasks, many=True, context={'project': project})
+        serializer.is_valid(raise_exception=True)
+        tasks = serializer.save(project_id=project.id)
+        emit_webhooks_for_instance(user.active_organization, project, WebhookAction.TASKS_CREATED, tasks)
+
+        recalculate_stats_counts = {
+            'task_count': len(tasks),
+            'annotation_count': len(serializer.db_annotations),
+            'prediction_count': len(serializer.db_predictions),
+        }
+        project.update_tasks_counters_and_task_states(
+            tasks_queryset=tasks,
+            maximum_annotations_changed=False,
+            overlap_cohort_percentage_changed=False,
+            tasks_number_changed=True,
+            recalculate_stats_counts=recalculate_stats_counts,
+        )
+        summary.update_data_columns(tasks)
+    return tasks, recalculate_stats_counts
+
+
+def async_import_chunks(project_import, user, chunk_size):
+    """Streaming import of uploaded files: tasks are parsed incrementally, validated and saved in chunks
+
+    Memory is bounded by the chunk size instead of the files size. Each chunk is committed separately
+    and project_import counters show the import progress.
+    """
+    start = time.time()
+    project = project_import.project
+    found = {}
+    parsed_tasks = iter(
+        FileUpload.iter_tasks_from_uploaded_files(project, project_import.file_upload_ids, found=found)
+    )
+
+    for chunk in iter(lambda: list(islice(parsed_tasks, chunk_size)), []):
+        if project_import.task_count + len(chunk) > settings.TASKS_MAX_NUMBER:
+            raise ValidationError(
+                f'Maximum task number is {settings.TASKS_MAX_NUMBER}, '
+                f'current task number is more than {project_import.task_count + len(chunk)}'
+            )
+        if project_import.preannotated_from_fields:
+            chunk = reformat_predictions(chunk, project_import.preannotated_from_fields)
+
+        tasks, counts = _import_tasks_chunk(project, user, chunk)
+        if project_import.return_task_ids:
+            project_import.task_ids += [task.id for task in tasks]
+        project_import.task_count += counts['task_count']
+        project_import.annotation_count += counts['annotation_count']
+        project_import.prediction_count += counts['prediction_count']
+        project_import.duration = time.time() - start
+        project_import.save(
+            update_fields=['task_count', 'annotation_count', 'prediction_count', 'duration', 'task_ids']
+        )
+        logger.info(f'Import {project_import.id}: {project_import.task_count} tasks are imported')
+
+    if not project_import.task_count:
+        raise ValidationError('load_tasks: No tasks added')
+
+    project_import.duration = time.time() - start
+    project_import.found_formats = found.get('formats', {})
+    project_import.data_columns = list(found.get('data_columns', []))
+    project_import.status = ProjectImport.Status.COMPLETED
+    project_import.save()
+
+
 def set_import_background_failure(job, connection, type, value, _):
     import_id = job.args[0]
     ProjectImport.objects.filter(id=import_id).update(
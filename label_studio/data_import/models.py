@@ -5,6 +5,7 @@ import os
 import uuid
 from collections import Counter
 
+import ijson
 import pandas as pd
 
 try:
@@ -88,6 +89,14 @@ class FileUpload(models.Model):
         tasks = [{'data': {settings.DATA_UNDEFINED_NAME: line}} for line in lines]
         return tasks
 
+    @staticmethod
+    def _format_json_task(task):
+        if not task.get('data'):
+            task = {'data': task}
+        if not isinstance(task['data'], dict):
+            raise ValidationError('Task item should be dict')
+        return task
+
     def read_tasks_list_from_json(self):
         logger.debug('Read tasks list from JSON file {}'.format(self.filepath))
 
@@ -101,13 +110,22 @@ class FileUpload(models.Model):
             tasks = [tasks]
         tasks_formatted = []
         for i, task in enumerate(tasks):
-            if not task.get('data'):
-                task = {'data': task}
-            if not isinstance(task['data'], dict):
-                raise ValidationError('Task item should be dict')
-            tasks_formatted.append(task)
+            tasks_formatted.append(self._format_json_task(task))
         return tasks_formatted
 
+    def iter_tasks_from_json(self):
+        """Parse tasks from JSON array one by one without reading the whole file into memory"""
+        logger.debug('Iterate tasks from JSON file {}'.format(self.filepath))
+        with self.file.open('rb') as f:
+            head = f.read(1024).lstrip()
+            f.seek(0)
+            if not head.startswith(b'['):
+                # single task object
+                yield self._format_json_task(json.loads(f.read()))
+                return
+            for task in ijson.items(f, 'item', use_float=True):
+                yield self._format_json_task(task)
+
     def read_task_from_hypertext_body(self):
         logger.debug('Read 1 task from hypertext file {}'.format(self.filepath))
         body = self.content
@@ -156,6 +174,16 @@ class FileUpload(models.Model):
             raise ValidationError('Failed to parse input file ' + self.file_name + ': ' + str(exc))
         return tasks
 
+    def iter_tasks(self, file_as_tasks_list=True):
+        """Tasks from the file one by one, JSON arrays are parsed incrementally, see read_tasks"""
+        if self.format != '.json':
+            yield from self.read_tasks(file_as_tasks_list)
+            return
+        try:
+            yield from self.iter_tasks_from_json()
+        except Exception as exc:
+            raise ValidationError('Failed to parse input file ' + self.file_name + ': ' + str(exc))
+
     @classmethod
     def load_tasks_from_uploaded_files(
         cls, project, file_upload_ids=None, formats=None, files_as_tasks_list=True, trim_size=None
@@ -197,6 +225,39 @@ class FileUpload(models.Model):
 
         return tasks, dict(Counter(fileformats)), common_data_fields
 
+    @classmethod
+    def iter_tasks_from_uploaded_files(cls, project, file_upload_ids=None, files_as_tasks_list=True, found=None):
+        """Streaming version of load_tasks_from_uploaded_files, yields tasks one by one
+
+        found: dict to fill with 'formats' and 'data_columns' of files read so far
+        """
+        found = {} if found is None else found
+        fileformats = []
+        common_data_fields = set()
+
+        file_uploads = FileUpload.objects.filter(project=project)
+        if file_upload_ids:
+            file_uploads = file_uploads.filter(id__in=file_upload_ids)
+        for file_upload in file_uploads:
+            fileformats.append(file_upload.format)
+            found['formats'] = dict(Counter(fileformats))
+            for i, task in enumerate(file_upload.iter_tasks(files_as_tasks_list)):
+                task['file_upload_id'] = file_upload.id
+                if i == 0:
+                    new_data_fields = set(task['data'].keys())
+                    if not common_data_fields:
+                        common_data_fields = new_data_fields
+                    elif not common_data_fields.intersection(new_data_fields):
+                        raise ValidationError(
+                            _old_vs_new_data_keys_inconsistency_message(
+                                new_data_fields, common_data_fields, file_upload.file.name
+                            )
+                        )
+                    else:
+                        common_data_fields &= new_data_fields
+                    found['data_columns'] = common_data_fields
+                yield task
+
 
 def _old_vs_new_data_keys_inconsistency_message(new_data_keys, old_data_keys, current_file):
     new_data_keys_list = ','.join(new_data_keys)
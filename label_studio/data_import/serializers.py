@@ -1,7 +1,7 @@
 """This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
 """
 from rest_framework import serializers
-from tasks.models import Task
+from tasks.models import STREAM_STATE_FIELDS, Task
 from tasks.serializers import AnnotationSerializer, PredictionSerializer, TaskSerializer, TaskSerializerBulk
 
 from .models import FileUpload
@@ -16,7 +16,7 @@ class ImportApiSerializer(TaskSerializer):
     class Meta:
         model = Task
         list_serializer_class = TaskSerializerBulk
-        exclude = ('is_labeled', 'project')
+        exclude = ('is_labeled', 'project', *STREAM_STATE_FIELDS)
 
 
 class FileUploadSerializer(serializers.ModelSerializer):
@@ -9,7 +9,7 @@ from django.db import transaction
 from drf_yasg import openapi
 from projects.models import Project
 from rest_framework import serializers
-from tasks.models import Task
+from tasks.models import STREAM_STATE_FIELDS, Task
 from tasks.serializers import (
     AnnotationDraftSerializer,
     AnnotationSerializer,
@@ -362,7 +362,7 @@ class DataManagerTaskSerializer(TaskSerializer):
     class Meta:
         model = Task
         ref_name = 'data_manager_task_serializer'
-        fields = '__all__'
+        exclude = STREAM_STATE_FIELDS
         expandable_fields = {'annotations': (AnnotationSerializer, {'many': True})}
 
     def to_representation(self, obj):
@@ -7,6 +7,7 @@ import json
 import logging
 import os
 import traceback as tb
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict
 from datetime import datetime
@@ -23,14 +24,14 @@ from data_export.serializers import ExportDataSerializer
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.db import models, transaction
-from django.db.models import JSONField
+from django.db.models import Count, JSONField
 from django.shortcuts import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rq import job
 from io_storages.utils import StorageObject, get_uri_via_regex, parse_bucket_uri
 from rq.job import Job
-from tasks.models import Annotation, Task
+from tasks.models import Annotation, Prediction, Task, update_tasks_stream_state
 from tasks.serializers import AnnotationSerializer, PredictionSerializer
 from webhooks.models import WebhookAction
 from webhooks.utils import emit_webhooks_for_instance
@@ -341,8 +342,9 @@ class ImportStorage(Storage):
 
         raise NotImplementedError
 
-    @classmethod
-    def add_task(cls, project, maximum_annotations, max_inner_id, storage, link_object: StorageObject, link_class):
+    @staticmethod
+    def _parse_link_object(link_object: StorageObject):
+        """Split storage object into link kwargs, task data, predictions, annotations and cancelled annotations count"""
         link_kwargs = asdict(link_object)
         data = link_kwargs.pop('task_data', None)
 
@@ -370,6 +372,12 @@ class ImportStorage(Storage):
             else:
                 data.pop('data')
 
+        return link_kwargs, data, predictions, annotations, cancelled_annotations
+
+    @classmethod
+    def add_task(cls, project, maximum_annotations, max_inner_id, storage, link_object: StorageObject, link_class):
+        link_kwargs, data, predictions, annotations, cancelled_annotations = cls._parse_link_object(link_object)
+
         with transaction.atomic():
             task = Task.objects.create(
                 data=data,
@@ -409,6 +417,142 @@ class ImportStorage(Storage):
         return task
         # FIXME: add_annotation_history / post_process_annotations should be here
 
+    @classmethod
+    def add_tasks(cls, project, maximum_annotations, max_inner_id, storage, link_objects, link_class):
+        """Batched add_task: bulk create tasks, storage links, predictions and annotations in one transaction
+
+        Predictions and annotations are validated per task with the same serializers as add_task,
+        task counters, stream state and project summary are updated for the whole batch
+        instead of per object signals.
+        """
+        parsed = [cls._parse_link_object(link_object) for link_object in link_objects]
+        raise_exception = not flag_set(
+            'ff_fix_back_dev_3342_storage_scan_with_invalid_annotations', user=AnonymousUser()
+        )
+
+        with transaction.atomic():
+            tasks = Task.objects.bulk_create(
+                [
+                    Task(
+                        data=data,
+                        project=project,
+                        overlap=maximum_annotations,
+                        is_labeled=len(annotations) >= maximum_annotations,
+                        total_predictions=len(predictions),
+                        total_annotations=len(annotations) - cancelled_annotations,
+                        cancelled_annotations=cancelled_annotations,
+                        inner_id=max_inner_id + i,
+                    )
+                    for i, (_, data, predictions, annotations, cancelled_annotations) in enumerate(parsed)
+                ],
+                batch_size=settings.BATCH_SIZE,
+            )
+
+            link_class.objects.bulk_create(
+                [
+                    link_class(task=task, storage=storage, object_exists=True, **link_kwargs)
+                    for task, (link_kwargs, *_) in zip(tasks, parsed)
+                ],
+                batch_size=settings.BATCH_SIZE,
+            )
+            logger.debug(f'Create {len(tasks)} {storage.__class__.__name__} links')
+
+            db_predictions, db_annotations = [], []
+            for task, (_, _, predictions, annotations, _) in zip(tasks, parsed):
+                for prediction in predictions:
+                    prediction['task'] = task.id
+                    prediction['project'] = project.id
+                prediction_ser = PredictionSerializer(data=predictions, many=True)
+                if prediction_ser.is_valid(raise_exception=raise_exception):
+                    for item in prediction_ser.validated_data:
+                        # bulk_create doesn't call Prediction.save() where result is normalized
+                        item['result'] = Prediction.prepare_prediction_result(item['result'], project)
+                        db_predictions.append(Prediction(**item))
+
+                for annotation in annotations:
+                    annotation['task'] = task.id
+                    annotation['project'] = project.id
+                annotation_ser = AnnotationSerializer(data=annotations, many=True)
+                if annotation_ser.is_valid(raise_exception=raise_exception):
+                    for item in annotation_ser.validated_data:
+                        db_annotation = Annotation(**item)
+                        # bulk_create doesn't call Annotation.save() where result_count is calculated
+                        db_annotation.result_count = len({r.get('id') for r in (db_annotation.result or [])})
+                        db_annotations.append(db_annotation)
+
+            Prediction.objects.bulk_create(db_predictions, batch_size=settings.BATCH_SIZE)
+            db_annotations = Annotation.objects.bulk_create(db_annotations, batch_size=settings.BATCH_SIZE)
+            logger.debug(f'Create {len(db_predictions)} predictions and {len(db_annotations)} annotations')
+
+            update_tasks_stream_state(Task.objects.filter(id__in=[task.id for task in tasks]))
+            project.summary.update_data_columns(tasks)
+            project.summary.update_created_annotations_and_labels(db_annotations)
+        return tasks
+
+    def _iter_new_keys(self, link_class, counters):
+        """Keys that have not been synced yet, counters['tasks_existed'] counts tasks of skipped keys
+
+        Keys are checked for existing links in chunks of STORAGE_SYNC_KEYS_CHUNK_SIZE with one query per chunk.
+        """
+        for keys in _batched(self.iterkeys(), settings.STORAGE_SYNC_KEYS_CHUNK_SIZE):
+            self.info_update_progress(
+                last_sync_count=counters['tasks_created'], tasks_existed=counters['tasks_existed']
+            )
+            linked = link_class.n_tasks_linked_by_key(keys, self)
+            for key in keys:
+                # w/o Dataflow
+                # pubsub.push(topic, key)
+                # -> GF.pull(topic, key) + env -> add_task()
+                logger.debug(f'Scanning key {key}')
+
+                # skip if key has already been synced
+                if n_tasks_linked := linked.get(key):
+                    logger.debug(f'{self.__class__.__name__} already has {n_tasks_linked} tasks linked to {key=}')
+                    counters['tasks_existed'] += n_tasks_linked  # update progress counter
+                    continue
+
+                logger.debug(f'{self}: found new key {key}')
+                yield key
+
+    def _get_link_objects(self, key, multitask):
+        try:
+            link_objects = self.get_data(key)
+        except (UnicodeDecodeError, json.decoder.JSONDecodeError) as exc:
+            logger.debug(exc, exc_info=True)
+            raise ValueError(
+                f'Error loading JSON from file "{key}".\nIf you\'re trying to import non-JSON data '
+                f'(images, audio, text, etc.), edit storage settings and enable '
+                f'"Treat every bucket object as a source file"'
+            )
+
+        if not multitask:
+            link_objects = link_objects[:1]
+        return link_objects
+
+    def _iter_new_link_objects(self, link_class, counters):
+        """Link objects from keys that have not been synced yet, in key order
+
+        With STORAGE_IMPORT_FETCH_WORKERS > 1 objects are fetched and parsed by a thread pool,
+        at most 2 * workers objects are fetched ahead of the consumer.
+        """
+        keys = self._iter_new_keys(link_class, counters)
+        multitask = flag_set('fflag_feat_dia_2092_multitasks_per_storage_link')
+        workers = settings.STORAGE_IMPORT_FETCH_WORKERS
+
+        if workers <= 1:
+            for key in keys:
+                yield from self._get_link_objects(key, multitask)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = deque()
+            for key in keys:
+                futures.append(executor.submit(self._get_link_objects, key, multitask))
+                if len(futures) >= 2 * workers:
+                    yield from futures.popleft().result()
+            while futures:
+                yield from futures.popleft().result()
+
     def _scan_and_create_links(self, link_class):
         """
         TODO: deprecate this function and transform it to "pipeline" version  _scan_and_create_links_v2,
@@ -417,69 +561,51 @@ class ImportStorage(Storage):
         # set in progress status for storage info
         self.info_set_in_progress()
 
-        tasks_existed = tasks_created = 0
+        counters = {'tasks_created': 0, 'tasks_existed': 0}
         maximum_annotations = self.project.maximum_annotations
         task = self.project.tasks.order_by('-inner_id').first()
         max_inner_id = (task.inner_id + 1) if task else 1
 
+        # STORAGE_IMPORT_BATCH_SIZE > 0 switches to bulk writes, otherwise tasks are created one by one
+        batch_size = settings.STORAGE_IMPORT_BATCH_SIZE
+        link_objects = self._iter_new_link_objects(link_class, counters)
+
         tasks_for_webhook = []
-        for key in self.iterkeys():
-            # w/o Dataflow
-            # pubsub.push(topic, key)
-            # -> GF.pull(topic, key) + env -> add_task()
-            logger.debug(f'Scanning key {key}')
-            self.info_update_progress(last_sync_count=tasks_created, tasks_existed=tasks_existed)
-
-            # skip if key has already been synced
-            if n_tasks_linked := link_class.n_tasks_linked(key, self):
-                logger.debug(f'{self.__class__.__name__} already has {n_tasks_linked} tasks linked to {key=}')
-                tasks_existed += n_tasks_linked  # update progress counter
-                continue
-
-            logger.debug(f'{self}: found new key {key}')
-            try:
-                link_objects = self.get_data(key)
-            except (UnicodeDecodeError, json.decoder.JSONDecodeError) as exc:
-                logger.debug(exc, exc_info=True)
-                raise ValueError(
-                    f'Error loading JSON from file "{key}".\nIf you\'re trying to import non-JSON data '
-                    f'(images, audio, text, etc.), edit storage settings and enable '
-                    f'"Treat every bucket object as a source file"'
-                )
+        for link_objects_batch in _batched(link_objects, max(batch_size, 1)):
+            self.info_update_progress(
+                last_sync_count=counters['tasks_created'], tasks_existed=counters['tasks_existed']
+            )
 
-            if not flag_set('fflag_feat_dia_2092_multitasks_per_storage_link'):
-                link_objects = link_objects[:1]
-
-            for link_object in link_objects:
-                # TODO: batch this loop body with add_task -> add_tasks in a single bulk write.
-                # See DIA-2062 for prerequisites
-                task = self.add_task(
-                    self.project,
-                    maximum_annotations,
-                    max_inner_id,
-                    self,
-                    link_object,
-                    link_class=link_class,
+            if batch_size > 0:
+                tasks = self.add_tasks(
+                    self.project, maximum_annotations, max_inner_id, self, link_objects_batch, link_class=link_class
                 )
-                max_inner_id += 1
-
-                # update progress counters for storage info
-                tasks_created += 1
-
-                # add task to webhook list
-                tasks_for_webhook.append(task)
-
-                # settings.WEBHOOK_BATCH_SIZE
-                # `WEBHOOK_BATCH_SIZE` sets the maximum number of tasks sent in a single webhook call, ensuring manageable payload sizes.
-                # When `tasks_for_webhook` accumulates tasks equal to/exceeding `WEBHOOK_BATCH_SIZE`, they're sent in a webhook via
-                # `emit_webhooks_for_instance`, and `tasks_for_webhook` is cleared for new tasks.
-                # If tasks remain in `tasks_for_webhook` at process end (less than `WEBHOOK_BATCH_SIZE`), they're sent in a final webhook
-                # call to ensure all tasks are processed and no task is left unreported in the webhook.
-                if len(tasks_for_webhook) >= settings.WEBHOOK_BATCH_SIZE:
-                    emit_webhooks_for_instance(
-                        self.project.organization, self.project, WebhookAction.TASKS_CREATED, tasks_for_webhook
+            else:
+                tasks = [
+                    self.add_task(
+                        self.project, maximum_annotations, max_inner_id, self, link_object, link_class=link_class
                     )
-                    tasks_for_webhook = []
+                    for link_object in link_objects_batch
+                ]
+            max_inner_id += len(tasks)
+
+            # update progress counters for storage info
+            counters['tasks_created'] += len(tasks)
+
+            # add tasks to webhook list
+            tasks_for_webhook.extend(tasks)
+
+            # settings.WEBHOOK_BATCH_SIZE
+            # `WEBHOOK_BATCH_SIZE` sets the maximum number of tasks sent in a single webhook call, ensuring manageable payload sizes.
+            # When `tasks_for_webhook` accumulates tasks equal to/exceeding `WEBHOOK_BATCH_SIZE`, they're sent in a webhook via
+            # `emit_webhooks_for_instance`, and `tasks_for_webhook` is cleared for new tasks.
+            # If tasks remain in `tasks_for_webhook` at process end (less than `WEBHOOK_BATCH_SIZE`), they're sent in a final webhook
+            # call to ensure all tasks are processed and no task is left unreported in the webhook.
+            if len(tasks_for_webhook) >= settings.WEBHOOK_BATCH_SIZE:
+                emit_webhooks_for_instance(
+                    self.project.organization, self.project, WebhookAction.TASKS_CREATED, tasks_for_webhook
+                )
+                tasks_for_webhook = []
         if tasks_for_webhook:
             emit_webhooks_for_instance(
                 self.project.organization, self.project, WebhookAction.TASKS_CREATED, tasks_for_webhook
@@ -490,7 +616,7 @@ class ImportStorage(Storage):
         )
 
         # sync is finished, set completed status for storage info
-        self.info_set_completed(last_sync_count=tasks_created, tasks_existed=tasks_existed)
+        self.info_set_completed(last_sync_count=counters['tasks_created'], tasks_existed=counters['tasks_existed'])
 
     def scan_and_create_links(self):
         """This is proto method - you can override it, or just replace ImportStorageLink by your own model"""
@@ -608,12 +734,16 @@ class ExportStorage(Storage, ProjectStorageMixin):
     # TODO from testing, more than 8 seems to cause problems. revisit to add more parallelism.
     max_workers = min(8, (os.cpu_count() or 2) * 4)
 
-    def _get_serialized_data(self, annotation):
+    def _save_task_format(self):
+        """Storage objects are whole tasks with annotations instead of single annotations"""
         user = self.project.organization.created_by
         flag = flag_set(
             'fflag_feat_optic_650_target_storage_task_format_long', user=user, override_system_default=False
         )
-        if settings.FUTURE_SAVE_TASK_TO_STORAGE or flag:
+        return settings.FUTURE_SAVE_TASK_TO_STORAGE or flag
+
+    def _get_serialized_data(self, annotation):
+        if self._save_task_format():
             # export task with annotations
             # TODO: we have to rewrite save_all_annotations, because this func will be called for each annotation
             # TODO: instead of each task, however, we have to call it only once per task
@@ -628,30 +758,43 @@ class ExportStorage(Storage, ProjectStorageMixin):
     def save_annotation(self, annotation):
         raise NotImplementedError
 
+    def save_task_annotations(self, annotations: list[Annotation]):
+        """Save one storage object for annotations of the same task and link all of them to it"""
+        self.save_annotation(annotations[0])
+        if len(annotations) > 1:
+            self.links.model.create_many(annotations[1:], self)
+
     def save_annotations(self, annotations: models.QuerySet[Annotation]):
         annotation_exported = 0
         total_annotations = annotations.count()
         self.info_set_in_progress()
         self.cached_user = self.project.organization.created_by
 
+        annotations = (
+            annotations.select_related('task')
+            .order_by('task_id', 'id')
+            .iterator(chunk_size=settings.STORAGE_EXPORT_CHUNK_SIZE)
+        )
+        if self._save_task_format():
+            # each storage object contains the whole task, so write it once for all its annotations
+            groups = (list(group) for _, group in itertools.groupby(annotations, key=lambda a: a.task_id))
+        else:
+            groups = ([annotation] for annotation in annotations)
+
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             # Batch annotations so that we update progress before having to submit every future.
             # Updating progress in thread requires coordinating on count and db writes, so just
             # batching to keep it simpler.
-            for annotation_batch in _batched(
-                Annotation.objects.filter(project=self.project).iterator(
-                    chunk_size=settings.STORAGE_EXPORT_CHUNK_SIZE
-                ),
-                settings.STORAGE_EXPORT_CHUNK_SIZE,
-            ):
-                futures = []
-                for annotation in annotation_batch:
-                    annotation.cached_user = self.cached_user
-                    futures.append(executor.submit(self.save_annotation, annotation))
+            for group_batch in _batched(groups, settings.STORAGE_EXPORT_CHUNK_SIZE):
+                futures = {}
+                for group in group_batch:
+                    for annotation in group:
+                        annotation.cached_user = self.cached_user
+                    futures[executor.submit(self.save_task_annotations, group)] = len(group)
 
                 for future in concurrent.futures.as_completed(futures):
-                    annotation_exported += 1
-                    self.info_update_progress(last_sync_count=annotation_exported, total_annotations=total_annotations)
+                    annotation_exported += futures[future]
+                self.info_update_progress(last_sync_count=annotation_exported, total_annotations=total_annotations)
 
         self.info_set_completed(last_sync_count=annotation_exported, total_annotations=total_annotations)
 
@@ -720,6 +863,17 @@ class ImportStorageLink(models.Model):
     def n_tasks_linked(cls, key, storage):
         return cls.objects.filter(key=key, storage=storage.id).count()
 
+    @classmethod
+    def n_tasks_linked_by_key(cls, keys, storage):
+        """Number of linked tasks for each of the keys that have links, one query for all keys"""
+        return dict(
+            cls.objects.filter(key__in=keys, storage=storage.id)
+            .order_by()
+            .values('key')
+            .annotate(n_tasks=Count('id'))
+            .values_list('key', 'n_tasks')
+        )
+
     @classmethod
     def create(cls, task, key, storage, row_index=None, row_group=None):
         link, created = cls.objects.get_or_create(
@@ -773,6 +927,20 @@ class ExportStorageLink(models.Model):
             link.save()
         return link
 
+    @classmethod
+    def create_many(cls, annotations, storage):
+        """Bulk version of create: add missing links and update updated_at of existing ones"""
+        links = cls.objects.filter(annotation__in=annotations, storage=storage.id, object_exists=True)
+        linked = set(links.values_list('annotation_id', flat=True))
+        links.update(updated_at=timezone.now())
+        cls.objects.bulk_create(
+            [
+                cls(annotation=annotation, storage=storage, object_exists=True)
+                for annotation in annotations
+                if annotation.id not in linked
+            ]
+        )
+
     def has_permission(self, user):
         user.project = self.annotation.project  # link for activity log
         if self.annotation.has_permission(user):
@@ -0,0 +1,73 @@
+import concurrent.futures
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from io_storages.localfiles.models import LocalFilesExportStorage
+from projects.models import Project
+from tasks.models import Annotation
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare export storage sync writing one object per annotation (previous behaviour) '
+        'with grouped per task writes, in task format. Objects are written to a temporary local files storage '
+        'which is removed afterwards together with its links.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help='project id')
+
+    def handle(self, *args, **options):
+        project = Project.objects.get(id=options['project'])
+        annotations = Annotation.objects.filter(project=project)
+        num_annotations = annotations.count()
+        num_tasks = annotations.values('task').distinct().count()
+
+        save_task_to_storage = settings.FUTURE_SAVE_TASK_TO_STORAGE
+        settings.FUTURE_SAVE_TASK_TO_STORAGE = True
+        try:
+            for mode in ('per annotation', 'per task'):
+                path = tempfile.mkdtemp()
+                storage = LocalFilesExportStorage.objects.create(project=project, path=path, title='benchmark')
+                try:
+                    start = time.perf_counter()
+                    writes = self._sync(storage, annotations, mode)
+                    elapsed = time.perf_counter() - start
+                finally:
+                    storage.delete()
+                    shutil.rmtree(path, ignore_errors=True)
+                self.stdout.write(
+                    f'{mode}: annotations={num_annotations} tasks={num_tasks} object writes={writes} '
+                    f'duration={elapsed:.2f}s annotations/s={num_annotations / elapsed:.0f}'
+                )
+        finally:
+            settings.FUTURE_SAVE_TASK_TO_STORAGE = save_task_to_storage
+
+    @staticmethod
+    def _sync(storage, annotations, mode):
+        writes = 0
+        save_annotation = storage.save_annotation
+
+        def counted_save_annotation(annotation):
+            nonlocal writes
+            writes += 1
+            save_annotation(annotation)
+
+        storage.save_annotation = counted_save_annotation
+        storage.info_set_queued()
+        if mode == 'per task':
+            storage.save_annotations(annotations)
+        else:
+            # export sync loop before annotations were grouped by task
+            storage.info_set_in_progress()
+            with ThreadPoolExecutor(max_workers=storage.max_workers) as executor:
+                futures = [
+                    executor.submit(storage.save_annotation, annotation)
+                    for annotation in annotations.iterator(chunk_size=settings.STORAGE_EXPORT_CHUNK_SIZE)
+                ]
+                concurrent.futures.wait(futures)
+        return writes
@@ -0,0 +1,86 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from io_storages.s3.models import S3ImportStorage, S3ImportStorageLink
+from io_storages.utils import StorageObject
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-key and batched task creation of import storage sync on synthetic storage objects. '
+        'Everything created during the benchmark is rolled back, the project is left untouched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help='project id')
+        parser.add_argument('--objects', type=int, default=1000, help='number of storage objects to import')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.BATCH_SIZE, help='number of objects per batched write'
+        )
+        parser.add_argument(
+            '--with-annotations', action='store_true', help='add one annotation and one prediction to each task'
+        )
+
+    def handle(self, *args, **options):
+        project = Project.objects.get(id=options['project'])
+        for batch_size in (0, options['batch_size']):
+            link_objects = self._make_link_objects(options['objects'], options['with_annotations'])
+            elapsed, queries = self._run(project, link_objects, batch_size)
+            self.stdout.write(
+                f"{'batched' if batch_size else 'per-key'}: objects={len(link_objects)} "
+                f'batch_size={batch_size or 1} queries={queries} '
+                f'duration={elapsed:.2f}s tasks/s={len(link_objects) / elapsed:.0f}'
+            )
+
+    @staticmethod
+    def _make_link_objects(n, with_annotations):
+        link_objects = []
+        for i in range(n):
+            task_data = {'data': {'text': f'benchmark task {i}'}}
+            if with_annotations:
+                result = [
+                    {
+                        'from_name': 'label',
+                        'to_name': 'text',
+                        'type': 'choices',
+                        'value': {'choices': ['benchmark']},
+                    }
+                ]
+                task_data['annotations'] = [{'result': result}]
+                task_data['predictions'] = [{'result': result, 'model_version': 'benchmark'}]
+            link_objects.append(StorageObject(task_data=task_data, key=f'benchmark/{i // 10}.json', row_index=i % 10))
+        return link_objects
+
+    @staticmethod
+    def _run(project, link_objects, batch_size):
+        maximum_annotations = project.maximum_annotations
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with transaction.atomic(), connection.execute_wrapper(count_queries):
+            storage = S3ImportStorage.objects.create(project=project, bucket='benchmark', use_blob_urls=False)
+            task = project.tasks.order_by('-inner_id').first()
+            max_inner_id = (task.inner_id + 1) if task else 1
+
+            start = time.perf_counter()
+            if batch_size:
+                for i in range(0, len(link_objects), batch_size):
+                    batch = link_objects[i : i + batch_size]
+                    S3ImportStorage.add_tasks(
+                        project, maximum_annotations, max_inner_id + i, storage, batch, S3ImportStorageLink
+                    )
+            else:
+                for i, link_object in enumerate(link_objects):
+                    S3ImportStorage.add_task(
+                        project, maximum_annotations, max_inner_id + i, storage, link_object, S3ImportStorageLink
+                    )
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed, queries
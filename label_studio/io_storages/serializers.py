@@ -5,7 +5,7 @@ import os
 from django.conf import settings
 from io_storages.base_models import ExportStorage, ImportStorage
 from rest_framework import serializers
-from tasks.models import Task
+from tasks.models import STREAM_STATE_FIELDS, Task
 from tasks.serializers import AnnotationSerializer, TaskSerializer
 from users.models import User
 
@@ -45,7 +45,7 @@ class StorageTaskSerializer(TaskSerializer):
 
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = STREAM_STATE_FIELDS
 
 
 class StorageCompletedBySerializer(serializers.ModelSerializer):
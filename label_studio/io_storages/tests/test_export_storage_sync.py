@@ -0,0 +1,64 @@
+import json
+
+import mock
+import pytest
+from io_storages.localfiles.models import LocalFilesExportStorage, LocalFilesExportStorageLink
+from projects.tests.factories import ProjectFactory
+from tasks.models import Annotation
+from tasks.tests.factories import AnnotationFactory, TaskFactory
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def project_with_annotations():
+    project = ProjectFactory()
+    tasks = [TaskFactory(project=project) for _ in range(2)]
+    for task, num_annotations in zip(tasks, (3, 1)):
+        for _ in range(num_annotations):
+            AnnotationFactory(task=task, project=project)
+    return project, tasks
+
+
+def _sync(storage, save_only_new_annotations=False):
+    storage.info_set_queued()
+    save_annotation = LocalFilesExportStorage.save_annotation
+    # concurrent writers lock sqlite test database tables
+    with mock.patch.object(LocalFilesExportStorage, 'max_workers', 1), mock.patch.object(
+        LocalFilesExportStorage, 'save_annotation', autospec=True, side_effect=save_annotation
+    ) as saved:
+        if save_only_new_annotations:
+            storage.save_only_new_annotations()
+        else:
+            storage.save_all_annotations()
+    storage.refresh_from_db()
+    return sorted(call.args[1].task_id for call in saved.call_args_list)
+
+
+def test_export_sync_writes_one_object_per_task(settings, tmp_path, project_with_annotations):
+    settings.FUTURE_SAVE_TASK_TO_STORAGE = True
+    project, tasks = project_with_annotations
+    storage = LocalFilesExportStorage.objects.create(project=project, path=str(tmp_path))
+
+    assert _sync(storage) == [tasks[0].id, tasks[1].id]
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f'{task.id}.json' for task in tasks)
+    assert len(json.loads((tmp_path / f'{tasks[0].id}.json').read_text())['annotations']) == 3
+    assert LocalFilesExportStorageLink.objects.filter(storage=storage).count() == 4
+    assert storage.last_sync_count == 4
+
+    # only the task of the annotation without link is written again
+    annotation = Annotation.objects.filter(task=tasks[0]).first()
+    LocalFilesExportStorageLink.objects.filter(annotation=annotation).delete()
+    assert _sync(storage, save_only_new_annotations=True) == [tasks[0].id]
+    assert LocalFilesExportStorageLink.objects.filter(storage=storage).count() == 4
+    assert storage.last_sync_count == 1
+
+
+def test_export_sync_writes_one_object_per_annotation(settings, tmp_path, project_with_annotations):
+    settings.FUTURE_SAVE_TASK_TO_STORAGE = False
+    project, tasks = project_with_annotations
+    storage = LocalFilesExportStorage.objects.create(project=project, path=str(tmp_path))
+
+    assert _sync(storage) == [tasks[0].id] * 3 + [tasks[1].id]
+    assert len(list(tmp_path.iterdir())) == 4
+    assert storage.last_sync_count == 4
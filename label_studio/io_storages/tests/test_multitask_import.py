@@ -1,8 +1,11 @@
+import copy
 import json
 
 import boto3
 import mock
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from io_storages.models import S3ImportStorage
 from io_storages.s3.models import S3ImportStorageLink
 from io_storages.tests.factories import (
@@ -13,6 +16,7 @@ from io_storages.tests.factories import (
 )
 from io_storages.utils import StorageObject, load_tasks_json
 from moto import mock_s3
+from projects.models import ProjectSummary
 from projects.tests.factories import ProjectFactory
 from rest_framework.test import APIClient
 from tests.utils import azure_client_mock, gcs_client_mock, mock_feature_flag, redis_client_mock
@@ -199,6 +203,45 @@ def test_storagelink_fields(project, common_task_data):
         assert storage_links[1].row_group is None
 
 
+@pytest.mark.fflag_feat_dia_2092_multitasks_per_storage_link_on
+def test_import_multiple_tasks_s3_batched(project, common_task_data, settings):
+    settings.STORAGE_IMPORT_BATCH_SIZE = 10
+    test_import_multiple_tasks_s3(project, common_task_data)
+
+    assert list(project.tasks.order_by('inner_id').values_list('inner_id', flat=True)) == [1, 2]
+    assert S3ImportStorageLink.objects.filter(task__project=project).count() == len(common_task_data)
+
+
+def _resync_queries(project, num_keys):
+    with mock_s3():
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='pytest-s3-resync')
+        for i in range(num_keys):
+            s3.put_object(Bucket='pytest-s3-resync', Key=f'{i}.json', Body=json.dumps({'text': f'task {i}'}))
+
+        storage = S3ImportStorage.objects.create(
+            project=project,
+            bucket='pytest-s3-resync',
+            aws_access_key_id='example',
+            aws_secret_access_key='example',
+            use_blob_urls=False,
+        )
+        storage.sync()
+        assert project.tasks.count() == num_keys
+
+        with CaptureQueriesContext(connection) as captured:
+            storage.sync()
+        assert project.tasks.count() == num_keys
+        storage.refresh_from_db()
+        assert storage.meta['tasks_existed'] == num_keys
+        return len(captured)
+
+
+def test_resync_checks_linked_keys_in_bulk(settings):
+    settings.STORAGE_SYNC_KEYS_CHUNK_SIZE = 100
+    assert _resync_queries(ProjectFactory(), 2) == _resync_queries(ProjectFactory(), 10)
+
+
 #
 # Unit tests for load_tasks_json()
 #
@@ -421,3 +464,47 @@ def test_list_jsonl_with_datetimes(storage):
     assert output == expected_output
 
     create_tasks(storage, output)
+
+
+def _imported_state(project):
+    tasks = project.tasks.order_by('inner_id')
+    return (
+        list(
+            tasks.values_list(
+                'data',
+                'inner_id',
+                'is_labeled',
+                'total_annotations',
+                'cancelled_annotations',
+                'total_predictions',
+                'stream_finished_annotations',
+            )
+        ),
+        [list(task.annotations.values_list('result', 'result_count', 'was_cancelled')) for task in tasks],
+        [list(task.predictions.values_list('result', 'model_version')) for task in tasks],
+        list(S3ImportStorageLink.objects.filter(task__project=project).order_by('task__inner_id').values_list('key', 'row_index')),
+    )
+
+
+def test_add_tasks_matches_add_task(storage):
+    blob = json.dumps(annots_preds_task_list + bare_task_list).encode()
+
+    project, one_by_one_storage = storage
+    for i, link_object in enumerate(load_tasks_json(blob, 'test.json')):
+        S3ImportStorage.add_task(
+            project, 1, i + 1, one_by_one_storage, copy.deepcopy(link_object), S3ImportStorageLink
+        )
+
+    batched_project = ProjectFactory()
+    batched_storage = S3ImportStorage.objects.create(project=batched_project, bucket='example', use_blob_urls=False)
+    tasks = S3ImportStorage.add_tasks(
+        batched_project, 1, 1, batched_storage, load_tasks_json(blob, 'test.json'), S3ImportStorageLink
+    )
+
+    assert len(tasks) == len(annots_preds_task_list + bare_task_list)
+    assert _imported_state(batched_project) == _imported_state(project)
+    batched_summary = ProjectSummary.objects.get(project=batched_project)
+    summary = ProjectSummary.objects.get(project=project)
+    assert batched_summary.created_annotations == summary.created_annotations
+    assert batched_summary.created_labels == summary.created_labels
+    assert batched_summary.common_data_columns == summary.common_data_columns
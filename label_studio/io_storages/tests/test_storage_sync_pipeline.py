@@ -0,0 +1,76 @@
+import threading
+import time
+
+import mock
+import pytest
+from io_storages.models import S3ImportStorage
+from io_storages.utils import StorageObject
+from projects.tests.factories import ProjectFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class SlowStorageObjects:
+    """Fake object store: every get_data call takes `latency` seconds, tracks concurrency and fetch order"""
+
+    def __init__(self, num_keys, latency):
+        self.keys = [f'{i:03}.json' for i in range(num_keys)]
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.active = self.max_active = 0
+        self.fetched = []
+
+    def iterkeys(self):
+        return iter(self.keys)
+
+    def get_data(self, key):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        # later keys answer faster to shuffle completion order
+        time.sleep(self.latency * (1 - self.keys.index(key) / len(self.keys)))
+        with self.lock:
+            self.active -= 1
+            self.fetched.append(key)
+        return [StorageObject(task_data={'text': key}, key=key)]
+
+
+@pytest.mark.parametrize('workers, batch_size', [(1, 0), (4, 0), (4, 5)])
+def test_sync_fetches_objects_ahead_in_order(settings, workers, batch_size):
+    settings.STORAGE_IMPORT_FETCH_WORKERS = workers
+    settings.STORAGE_IMPORT_BATCH_SIZE = batch_size
+    project = ProjectFactory()
+    storage = S3ImportStorage.objects.create(project=project, bucket='fake', use_blob_urls=False)
+    objects = SlowStorageObjects(num_keys=24, latency=0.05)
+
+    # number of objects fetched when each task creation starts
+    fetched_before_create = []
+    add_task, add_tasks = S3ImportStorage.add_task, S3ImportStorage.add_tasks
+
+    def record_add_task(instance, *args, **kwargs):
+        fetched_before_create.append(len(objects.fetched))
+        return add_task(*args, **kwargs)
+
+    def record_add_tasks(instance, *args, **kwargs):
+        fetched_before_create.append(len(objects.fetched))
+        return add_tasks(*args, **kwargs)
+
+    with mock.patch.object(S3ImportStorage, 'iterkeys', objects.iterkeys), mock.patch.object(
+        S3ImportStorage, 'get_data', objects.get_data
+    ), mock.patch.object(S3ImportStorage, 'add_task', record_add_task), mock.patch.object(
+        S3ImportStorage, 'add_tasks', record_add_tasks
+    ):
+        storage.info_set_queued()
+        storage.scan_and_create_links()
+
+    tasks = list(project.tasks.order_by('inner_id').values_list('inner_id', 'data'))
+    assert tasks == [(i + 1, {'text': key}) for i, key in enumerate(objects.keys)]
+    assert objects.max_active <= workers
+    if workers > 1:
+        assert objects.max_active > 1
+
+    # backpressure: the fetch stage never runs further ahead than its queue
+    created = 0
+    for fetched in fetched_before_create:
+        assert fetched - created <= max(batch_size, 1) + 2 * workers
+        created += max(batch_size, 1)
@@ -1,14 +1,30 @@
 import logging
 from collections import Counter
-from typing import List, Tuple, Union
+from typing import List, NamedTuple, Tuple, Union
 
 from core.feature_flags import flag_set
 from core.utils.common import conditional_atomic, db_is_not_sqlite, load_func
 from django.conf import settings
-from django.db.models import BooleanField, Case, Count, Exists, F, Max, OuterRef, Q, QuerySet, Value, When
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    Exists,
+    F,
+    IntegerField,
+    Max,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+    Value,
+    When,
+)
 from django.db.models.fields import DecimalField
+from django.db.models.functions import Coalesce
 from projects.functions.stream_history import add_stream_history
 from projects.models import Project
+from tasks.locks import get_task_lock_backend
 from tasks.models import Annotation, Task
 from users.models import User
 
@@ -24,7 +40,140 @@ def get_next_task_logging_level(user: User) -> int:
     return level
 
 
-def _get_random_unlocked(task_query: QuerySet[Task], user: User, upper_limit=None) -> Union[Task, None]:
+class LockEligibility(NamedTuple):
+    fields: dict
+    eligible: Q
+    overflowed: Q
+    locks_in_sql: bool
+
+
+def _get_stream_state_num_annotations(user: User, project: Project):
+    """Number of annotations counted by Task.has_lock(user) built from task stream state columns
+
+    Only annotations of the user are looked up, for other annotations no joins are needed.
+    Returns None if stream state is disabled or the project excludes more annotations than skip queue does.
+    """
+    if not settings.NEXT_TASK_USE_STREAM_STATE or project.get_rejected_query():
+        return None
+
+    num_annotations = F('stream_finished_annotations') + F('stream_skipped_annotations')
+    if project.skip_queue == project.SkipQueue.IGNORE_SKIPPED:
+        return num_annotations
+
+    user_skipped_tasks = Annotation.objects.filter(
+        project=project, completed_by=user, was_cancelled=True, ground_truth=False
+    ).values('task')
+    user_skipped = Case(When(pk__in=user_skipped_tasks, then=Value(1)), default=Value(0), output_field=IntegerField())
+    if project.skip_queue == project.SkipQueue.REQUEUE_FOR_ME:
+        # my skipped annotations are not counted
+        return num_annotations - user_skipped
+    # REQUEUE_FOR_OTHERS: only my skipped annotations are counted
+    return F('stream_finished_annotations') + user_skipped
+
+
+def _get_lock_eligibility(user: User, project: Project) -> Union[LockEligibility, None]:
+    """Build annotations and filters that reproduce `Task.has_lock(user)` as SQL conditions
+
+    Returns annotations for the tasks queryset, a filter for not locked tasks
+    and a filter for tasks taken more times than their overlap allows.
+    Returns None when the project uses settings that can't be expressed in SQL
+    (e.g. agreement threshold based overlap), in this case the per-task lock probe is used.
+    """
+    if not settings.NEXT_TASK_SINGLE_QUERY_ENABLED:
+        return None
+    lse_project = getattr(project, 'lse_project', None)
+    if lse_project and lse_project.agreement_threshold is not None:
+        return None
+
+    num_annotations = _get_stream_state_num_annotations(user, project)
+    if num_annotations is None:
+        annotations = (
+            Annotation.objects.filter(task=OuterRef('pk'))
+            .exclude(project.get_lock_exclude_query(user))
+            .order_by()
+            .values('task')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        num_annotations = Coalesce(Subquery(annotations, output_field=IntegerField()), 0)
+    # locks kept outside of the database (e.g. in redis) are checked per candidate after the row is locked
+    num_locks = get_task_lock_backend().num_locks_subquery(user)
+    locks_in_sql = num_locks is not None
+    if not locks_in_sql:
+        num_locks = Value(0, output_field=IntegerField())
+    fields = {
+        '_lock_num_annotations': num_annotations,
+        '_lock_num_locks': num_locks,
+        '_lock_takes': num_annotations + num_locks,
+    }
+    eligible = Q(_lock_takes__lt=F('overlap'))
+    overflowed = Q(_lock_takes__gt=F('overlap'), is_labeled=False)
+
+    if project.show_ground_truth_first and flag_set(
+        'fflag_feat_all_leap_1825_annotator_evaluation_short', user='auto'
+    ):
+        # in onboarding mode ground truth tasks ignore overlap setting, see Task.has_lock()
+        if settings.NEXT_TASK_USE_STREAM_STATE:
+            fields['_lock_ground_truth'] = F('has_ground_truth')
+        else:
+            fields['_lock_ground_truth'] = Exists(Annotation.objects.filter(task=OuterRef('pk'), ground_truth=True))
+        eligible |= Q(_lock_ground_truth=True)
+        overflowed &= Q(_lock_ground_truth=False)
+
+    return LockEligibility(fields, eligible, overflowed, locks_in_sql)
+
+
+def _fix_overflowed_tasks(tasks_query: QuerySet[Task], fields: dict, overflowed: Q) -> None:
+    """Repair is_labeled for candidates taken more times than overlap, the same as Task.has_lock() does"""
+    overflowed_tasks = (
+        Task.objects.filter(pk__in=tasks_query.order_by().values('pk'))
+        .annotate(**fields)
+        .filter(overflowed)
+        .select_related('project')[: settings.RANDOM_NEXT_TASK_SAMPLE_SIZE]
+    )
+    for task in overflowed_tasks:
+        task.fix_is_labeled_on_overflow(task._lock_num_locks, task._lock_num_annotations)
+
+
+def _get_unlocked_with_single_query(
+    tasks_query: QuerySet[Task], user: User, eligibility: LockEligibility, randomize: bool
+) -> Union[Task, None]:
+    """Select not locked candidates with one query and acquire a row lock on the first available one"""
+    fields, eligible, overflowed, locks_in_sql = eligibility
+    _fix_overflowed_tasks(tasks_query, fields, overflowed)
+
+    candidates = tasks_query.annotate(**fields).filter(eligible)
+    if randomize:
+        # random sampling checks one sample only, the same as the per-task lock probe
+        task_ids = candidates.order_by('?').values_list('id', flat=True)[: settings.RANDOM_NEXT_TASK_SAMPLE_SIZE]
+    else:
+        # walk one stable result set, so candidates leaving the queue concurrently don't shift the rest
+        task_ids = candidates.values_list('id', flat=True).iterator(chunk_size=settings.RANDOM_NEXT_TASK_SAMPLE_SIZE)
+
+    checked = set()
+    for task_id in task_ids:
+        if task_id in checked:
+            continue
+        checked.add(task_id)
+
+        task = Task.objects.select_for_update(skip_locked=True).filter(pk=task_id).first()
+        if task is None:
+            logger.debug('Task with id {} locked'.format(task_id))
+            continue
+        # the row lock is acquired, re-check that nobody has taken the task since candidates were selected
+        if not Task.objects.filter(pk=task_id).annotate(**fields).filter(eligible).exists():
+            continue
+        if locks_in_sql or not task.has_lock(user):
+            return task
+
+
+def _get_random_unlocked(
+    task_query: QuerySet[Task], user: User, upper_limit=None, project: Union[Project, None] = None
+) -> Union[Task, None]:
+    eligibility = _get_lock_eligibility(user, project) if project is not None else None
+    if eligibility is not None:
+        return _get_unlocked_with_single_query(task_query, user, eligibility, randomize=True)
+
     for task in task_query.order_by('?').only('id')[: settings.RANDOM_NEXT_TASK_SAMPLE_SIZE]:
         try:
             task = Task.objects.select_for_update(skip_locked=True).get(pk=task.id)
@@ -34,7 +183,13 @@ def _get_random_unlocked(task_query: QuerySet[Task], user: User, upper_limit=Non
             logger.debug('Task with id {} locked'.format(task.id))
 
 
-def _get_first_unlocked(tasks_query: QuerySet[Task], user) -> Union[Task, None]:
+def _get_first_unlocked(
+    tasks_query: QuerySet[Task], user, project: Union[Project, None] = None
+) -> Union[Task, None]:
+    eligibility = _get_lock_eligibility(user, project) if project is not None else None
+    if eligibility is not None:
+        return _get_unlocked_with_single_query(tasks_query, user, eligibility, randomize=False)
+
     # Skip tasks that are locked due to being taken by collaborators
     for task_id in tasks_query.values_list('id', flat=True):
         try:
@@ -48,14 +203,17 @@ def _get_first_unlocked(tasks_query: QuerySet[Task], user) -> Union[Task, None]:
 
 def _try_ground_truth(tasks: QuerySet[Task], project: Project, user: User) -> Union[Task, None]:
     """Returns task from ground truth set"""
-    ground_truth = Annotation.objects.filter(task=OuterRef('pk'), ground_truth=True)
-    not_solved_tasks_with_ground_truths = tasks.annotate(has_ground_truths=Exists(ground_truth)).filter(
-        has_ground_truths=True
-    )
+    if settings.NEXT_TASK_USE_STREAM_STATE:
+        not_solved_tasks_with_ground_truths = tasks.filter(has_ground_truth=True)
+    else:
+        ground_truth = Annotation.objects.filter(task=OuterRef('pk'), ground_truth=True)
+        not_solved_tasks_with_ground_truths = tasks.annotate(has_ground_truths=Exists(ground_truth)).filter(
+            has_ground_truths=True
+        )
     if not_solved_tasks_with_ground_truths.exists():
         if project.sampling == project.SEQUENCE:
-            return _get_first_unlocked(not_solved_tasks_with_ground_truths, user)
-        return _get_random_unlocked(not_solved_tasks_with_ground_truths, user)
+            return _get_first_unlocked(not_solved_tasks_with_ground_truths, user, project)
+        return _get_random_unlocked(not_solved_tasks_with_ground_truths, user, project=project)
 
 
 def _try_tasks_with_overlap(tasks: QuerySet[Task]) -> Tuple[Union[Task, None], QuerySet[Task]]:
@@ -67,10 +225,15 @@ def _try_tasks_with_overlap(tasks: QuerySet[Task]) -> Tuple[Union[Task, None], Q
         return None, tasks.filter(overlap=1)
 
 
-def _try_breadth_first(tasks: QuerySet[Task], user: User) -> Union[Task, None]:
+def _try_breadth_first(tasks: QuerySet[Task], user: User, project: Union[Project, None] = None) -> Union[Task, None]:
     """Try to find tasks with maximum amount of annotations, since we are trying to label tasks as fast as possible"""
 
-    tasks = tasks.annotate(annotations_count=Count('annotations', filter=~Q(annotations__completed_by=user)))
+    if settings.NEXT_TASK_USE_STREAM_STATE:
+        # tasks of the queue are not annotated by the user, so stream state counters can be used as is
+        annotations_count = F('stream_finished_annotations') + F('stream_skipped_annotations')
+    else:
+        annotations_count = Count('annotations', filter=~Q(annotations__completed_by=user))
+    tasks = tasks.annotate(annotations_count=annotations_count)
     max_annotations_count = tasks.aggregate(Max('annotations_count'))['annotations_count__max']
     if max_annotations_count == 0:
         # there is no any labeled tasks found
@@ -89,7 +252,7 @@ def _try_breadth_first(tasks: QuerySet[Task], user: User) -> Union[Task, None]:
     )
     if not_solved_tasks_labeling_with_max_annotations.exists():
         # try to complete tasks that are already in progress
-        return _get_random_unlocked(not_solved_tasks_labeling_with_max_annotations, user)
+        return _get_random_unlocked(not_solved_tasks_labeling_with_max_annotations, user, project=project)
 
 
 def _try_uncertainty_sampling(
@@ -127,17 +290,20 @@ def _try_uncertainty_sampling(
         if num_annotators > 1 and num_tasks_with_current_predictions > 0:
             # try to randomize tasks to avoid concurrent labeling between several annotators
             next_task = _get_random_unlocked(
-                possible_next_tasks, user, upper_limit=min(num_annotators + 1, num_tasks_with_current_predictions)
+                possible_next_tasks,
+                user,
+                upper_limit=min(num_annotators + 1, num_tasks_with_current_predictions),
+                project=project,
             )
         else:
-            next_task = _get_first_unlocked(possible_next_tasks, user)
+            next_task = _get_first_unlocked(possible_next_tasks, user, project)
     else:
         # uncertainty sampling fallback: choose by random sampling
         logger.debug(
             f'Uncertainty sampling fallbacks to random sampling '
             f'(current project.model_version={str(project.model_version)})'
         )
-        next_task = _get_random_unlocked(tasks, user)
+        next_task = _get_random_unlocked(tasks, user, project=project)
     return next_task
 
 
@@ -236,7 +402,7 @@ def get_next_task_without_dm_queue(
 
     if not next_task and prioritized_low_agreement:
         logger.debug(f'User={user} tries low agreement from prepared tasks')
-        next_task = _get_first_unlocked(not_solved_tasks, user)
+        next_task = _get_first_unlocked(not_solved_tasks, user, project)
         queue_info += (' & ' if queue_info else '') + 'Low agreement queue'
 
     if not next_task and project.show_ground_truth_first:
@@ -247,7 +413,7 @@ def get_next_task_without_dm_queue(
     if not next_task and project.maximum_annotations > 1:
         # if there are any tasks in progress (with maximum number of annotations), randomly sampling from them
         logger.debug(f'User={user} tries depth first from prepared tasks')
-        next_task = _try_breadth_first(not_solved_tasks, user)
+        next_task = _try_breadth_first(not_solved_tasks, user, project)
         if next_task:
             queue_info += (' & ' if queue_info else '') + 'Breadth first queue'
 
@@ -261,7 +427,7 @@ def skipped_queue(next_task, prepared_tasks, project, user, queue_info):
         if skipped_tasks.exists():
             preserved_order = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(skipped_tasks)])
             skipped_tasks = prepared_tasks.filter(pk__in=skipped_tasks).order_by(preserved_order)
-            next_task = _get_first_unlocked(skipped_tasks, user)
+            next_task = _get_first_unlocked(skipped_tasks, user, project)
             queue_info = 'Skipped queue'
 
     return next_task, queue_info
@@ -274,7 +440,7 @@ def postponed_queue(next_task, prepared_tasks, project, user, queue_info):
         if postponed_tasks.exists():
             preserved_order = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(postponed_tasks)])
             postponed_tasks = prepared_tasks.filter(pk__in=postponed_tasks).order_by(preserved_order)
-            next_task = _get_first_unlocked(postponed_tasks, user)
+            next_task = _get_first_unlocked(postponed_tasks, user, project)
             if next_task is not None:
                 next_task.allow_postpone = False
             queue_info = 'Postponed draft queue'
@@ -293,7 +459,7 @@ def get_task_from_qs_with_sampling(
     next_task = None
     if project.sampling == project.SEQUENCE:
         logger.debug(f'User={user} tries sequence sampling from prepared tasks')
-        next_task = _get_first_unlocked(not_solved_tasks, user)
+        next_task = _get_first_unlocked(not_solved_tasks, user, project)
         if next_task:
             queue_info += (' & ' if queue_info else '') + 'Sequence queue'
 
@@ -305,7 +471,7 @@ def get_task_from_qs_with_sampling(
 
     elif project.sampling == project.UNIFORM:
         logger.debug(f'User={user} tries random sampling from prepared tasks')
-        next_task = _get_random_unlocked(not_solved_tasks, user)
+        next_task = _get_random_unlocked(not_solved_tasks, user, project=project)
         if next_task:
             queue_info += (' & ' if queue_info else '') + 'Uniform random queue'
 
@@ -376,7 +542,7 @@ def get_next_task(
                 count = next_task.annotations.filter(was_cancelled=False).count()
                 task_overlap_reached = count >= next_task.overlap
                 global_overlap_reached = count >= project.maximum_annotations
-                locks = next_task.locks.count() > project.maximum_annotations - next_task.annotations.count()
+                locks = next_task.num_locks > project.maximum_annotations - next_task.annotations.count()
                 if next_task.is_labeled or task_overlap_reached or global_overlap_reached or locks:
                     from tasks.serializers import TaskSimpleSerializer
 
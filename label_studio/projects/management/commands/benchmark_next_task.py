@@ -0,0 +1,66 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from projects.functions.next_task import get_next_task
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure queries per call and latency of next task selection with concurrent annotators. '
+        'All locks taken during the benchmark are rolled back, the project is left untouched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help='project id')
+        parser.add_argument('--annotators', type=int, default=10, help='number of concurrent annotators')
+        parser.add_argument('--calls', type=int, default=20, help='number of next task calls per annotator')
+
+    def handle(self, *args, **options):
+        project = Project.objects.get(id=options['project'])
+        users = list(project.organization.users.order_by('id')[: options['annotators']])
+        if not users:
+            self.stderr.write(f'Project {project.id} organization has no users')
+            return
+
+        single_query_enabled = settings.NEXT_TASK_SINGLE_QUERY_ENABLED
+        try:
+            for single_query in (True, False):
+                settings.NEXT_TASK_SINGLE_QUERY_ENABLED = single_query
+                self._run(project, users, single_query, options['calls'])
+        finally:
+            settings.NEXT_TASK_SINGLE_QUERY_ENABLED = single_query_enabled
+
+    def _run(self, project, users, single_query, calls):
+        with ThreadPoolExecutor(max_workers=len(users)) as executor:
+            results = list(executor.map(lambda user: self._run_annotator(project, user, calls), users))
+
+        timings = sorted(t for user_timings, _ in results for t in user_timings)
+        queries = [q for _, user_queries in results for q in user_queries]
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{'single query' if single_query else 'per-task lock probe'}: "
+            f'annotators={len(users)} calls={len(timings)} '
+            f'queries/call avg={statistics.mean(queries):.1f} max={max(queries)} '
+            f'latency p50={statistics.median(timings) * 1000:.1f}ms p95={p95 * 1000:.1f}ms'
+        )
+
+    @staticmethod
+    def _run_annotator(project, user, calls):
+        timings, queries = [], []
+        try:
+            for _ in range(calls):
+                with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    get_next_task(user, project.tasks.order_by('id'), project, dm_queue=False)
+                    timings.append(time.perf_counter() - start)
+                    transaction.set_rollback(True)
+                queries.append(len(captured))
+        finally:
+            connection.close()
+        return timings, queries
@@ -9,6 +9,12 @@ if TYPE_CHECKING:
 
 
 class ProjectMixin:
+    def get_rejected_query(self):
+        """
+        Annotations that are excluded from the task lock check additionally to skipped ones
+        """
+        pass
+
     def rearrange_overlap_cohort(self):
         """
         Async start rearrange overlap depending on annotation count in tasks
@@ -856,6 +856,36 @@ class Project(ProjectMixin, models.Model):
         annotators = annotators.annotate(annotation_count=Count('annotations', filter=q, distinct=True))
         return annotators.filter(annotation_count__gte=min_count)
 
+    def get_lock_exclude_query(self, user):
+        """
+        Get query for excluding annotations from the lock check
+        """
+        SkipQueue = self.SkipQueue
+
+        if self.skip_queue == SkipQueue.IGNORE_SKIPPED:
+            # IGNORE_SKIPPED: my skipped tasks don't go anywhere
+            # alien's and my skipped annotations are counted as regular annotations
+            q = Q()
+        else:
+            if self.skip_queue == SkipQueue.REQUEUE_FOR_ME:
+                # REQUEUE_FOR_ME means: only my skipped tasks go back to me,
+                # alien's skipped annotations are counted as regular annotations
+                q = Q(was_cancelled=True) & Q(completed_by=user)
+            elif self.skip_queue == SkipQueue.REQUEUE_FOR_OTHERS:
+                # REQUEUE_FOR_OTHERS: my skipped tasks go to others
+                # alien's skipped annotations are not counted at all
+                q = Q(was_cancelled=True) & ~Q(completed_by=user)
+            else:
+                raise Exception(f'Invalid SkipQueue value: {self.skip_queue}')
+
+            # for LSE we also need to exclude rejected queue
+            rejected_q = self.get_rejected_query()
+
+            if rejected_q:
+                q &= rejected_q
+
+        return q | Q(ground_truth=True)
+
     def labeled_tasks(self):
         return self.tasks.filter(is_labeled=True)
 
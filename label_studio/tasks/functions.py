@@ -10,6 +10,7 @@ from core.redis import start_job_async_or_sync
 from core.utils.common import batch
 from data_export.mixins import ExportMixin
 from data_export.models import DataExport
+from data_export.raw_export import export_tasks_raw, is_raw_export_supported
 from data_export.serializers import ExportDataSerializer
 from data_manager.managers import TaskQuerySet
 from django.conf import settings
@@ -116,8 +117,14 @@ def export_project(project_id, export_format, path, serializer_context=None):
 
     # export cycle
     tasks = []
-    for _task_ids in batch(task_ids, 1000):
-        tasks += ExportDataSerializer(_task_ids, many=True, **serializer_options).data
+    if is_raw_export_supported(serializer_options):
+        for _task_ids in batch(Task.objects.filter(project=project).values_list('id', flat=True), 1000):
+            tasks += export_tasks_raw(
+                Task.objects.filter(id__in=_task_ids), Annotation.objects.all(), project, serializer_options
+            )
+    else:
+        for _task_ids in batch(task_ids, 1000):
+            tasks += ExportDataSerializer(_task_ids, many=True, **serializer_options).data
 
     # convert to output format
     export_file, _, filename = DataExport.generate_export_file(
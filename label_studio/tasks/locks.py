@@ -0,0 +1,188 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import datetime
+import logging
+import time
+import uuid
+
+from core.redis import get_redis_connection
+from django.conf import settings
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseTaskLockBackend:
+    """Task locks stored in TaskLock table"""
+
+    def acquire(self, task, user, ttl):
+        """Lock the task by user if the number of locks is less than task overlap, return True on success"""
+        from tasks.models import TaskLock
+
+        num_locks = self.num_locks(task)
+        if num_locks >= task.overlap:
+            return False
+
+        expire_at = now() + datetime.timedelta(seconds=ttl)
+        try:
+            task_lock = TaskLock.objects.get(task=task, user=user)
+        except TaskLock.DoesNotExist:
+            TaskLock.objects.create(task=task, user=user, expire_at=expire_at)
+        else:
+            task_lock.expire_at = expire_at
+            task_lock.save()
+        return True
+
+    def release(self, task, user=None):
+        if user is not None:
+            task.locks.filter(user=user).delete()
+        else:
+            task.locks.all().delete()
+
+    def clear_expired(self, task):
+        task.locks.filter(expire_at__lt=now()).delete()
+
+    def num_locks(self, task, exclude_user=None):
+        locks = task.locks.filter(expire_at__gt=now())
+        if exclude_user is not None:
+            locks = locks.exclude(user=exclude_user)
+        return locks.count()
+
+    def get_locks(self, task):
+        """List of (user id, expire at) for all task locks"""
+        return list(task.locks.values_list('user', 'expire_at'))
+
+    def get_unique_id(self, task, user):
+        lock = task.locks.filter(user=user).first()
+        if lock:
+            return lock.unique_id
+
+    def get_locked_tasks(self, user, tasks):
+        """Filter tasks locked by user"""
+        return tasks.filter(locks__user=user, locks__expire_at__gt=now())
+
+    def num_locks_subquery(self, user):
+        """SQL expression with the number of active locks of other users for OuterRef('pk') task"""
+        from tasks.models import TaskLock
+
+        locks = (
+            TaskLock.objects.filter(task=OuterRef('pk'), expire_at__gt=now())
+            .exclude(user=user)
+            .order_by()
+            .values('task')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        return Coalesce(Subquery(locks, output_field=IntegerField()), 0)
+
+
+class RedisTaskLockBackend:
+    """Task locks stored in redis sorted sets with lock expiration timestamps as scores
+
+    `task_lock:<task id>` keeps `<user id>:<lock unique id>` members,
+    `task_lock:user:<user id>` keeps ids of tasks locked by the user.
+    Expired members are removed on each write and both keys expire with the longest lock.
+    """
+
+    def __init__(self, connection):
+        self.redis = connection
+
+    @staticmethod
+    def _task_key(task_id):
+        return f'task_lock:{task_id}'
+
+    @staticmethod
+    def _user_key(user_id):
+        return f'task_lock:user:{user_id}'
+
+    @staticmethod
+    def _member_user_id(member):
+        return int(member.split(b':', 1)[0])
+
+    def _active_members(self, task_id):
+        return self.redis.zrangebyscore(self._task_key(task_id), time.time(), '+inf')
+
+    def acquire(self, task, user, ttl):
+        """Lock the task by user if the number of locks is less than task overlap, return True on success
+
+        Lock check and write run in one redis transaction, concurrent writers to the same task are retried.
+        """
+        task_key, user_key = self._task_key(task.id), self._user_key(user.id)
+
+        def _acquire(pipe):
+            timestamp = time.time()
+            members = pipe.zrangebyscore(task_key, timestamp, '+inf')
+            own = [member for member in members if self._member_user_id(member) == user.id]
+            if not own and len(members) >= task.overlap:
+                return False
+
+            member = own[0] if own else f'{user.id}:{uuid.uuid4()}'
+            expire_at = timestamp + ttl
+            pipe.multi()
+            pipe.zremrangebyscore(task_key, '-inf', timestamp)
+            pipe.zadd(task_key, {member: expire_at})
+            pipe.expire(task_key, int(ttl) + 1)
+            pipe.zadd(user_key, {task.id: expire_at})
+            pipe.expire(user_key, int(ttl) + 1)
+            return True
+
+        return self.redis.transaction(_acquire, task_key, value_from_callable=True)
+
+    def release(self, task, user=None):
+        task_key = self._task_key(task.id)
+        members = self.redis.zrange(task_key, 0, -1)
+        if user is not None:
+            members = [member for member in members if self._member_user_id(member) == user.id]
+        if not members:
+            return
+
+        pipe = self.redis.pipeline()
+        pipe.zrem(task_key, *members)
+        for user_id in {self._member_user_id(member) for member in members}:
+            pipe.zrem(self._user_key(user_id), task.id)
+        pipe.execute()
+
+    def clear_expired(self, task):
+        self.redis.zremrangebyscore(self._task_key(task.id), '-inf', time.time())
+
+    def num_locks(self, task, exclude_user=None):
+        members = self._active_members(task.id)
+        if exclude_user is not None:
+            members = [member for member in members if self._member_user_id(member) != exclude_user.id]
+        return len(members)
+
+    def get_locks(self, task):
+        """List of (user id, expire at) for all task locks"""
+        return [
+            (self._member_user_id(member), datetime.datetime.fromtimestamp(score, tz=datetime.timezone.utc))
+            for member, score in self.redis.zrange(self._task_key(task.id), 0, -1, withscores=True)
+        ]
+
+    def get_unique_id(self, task, user):
+        for member in self._active_members(task.id):
+            if self._member_user_id(member) == user.id:
+                return uuid.UUID(member.split(b':', 1)[1].decode())
+
+    def get_locked_tasks(self, user, tasks):
+        """Filter tasks locked by user"""
+        user_key = self._user_key(user.id)
+        timestamp = time.time()
+        self.redis.zremrangebyscore(user_key, '-inf', timestamp)
+        task_ids = [int(task_id) for task_id in self.redis.zrangebyscore(user_key, timestamp, '+inf')]
+        return tasks.filter(pk__in=task_ids)
+
+    def num_locks_subquery(self, user):
+        """Locks are not visible to SQL, callers have to check them per task"""
+        return None
+
+
+def get_task_lock_backend():
+    """Task lock backend from TASK_LOCK_BACKEND setting, redis backend falls back to database if redis is down"""
+    if settings.TASK_LOCK_BACKEND == 'redis':
+        connection = get_redis_connection()
+        if connection is not None:
+            return RedisTaskLockBackend(connection)
+        logger.debug('TASK_LOCK_BACKEND=redis, but redis is not connected: task locks are stored in database')
+    return DatabaseTaskLockBackend()
@@ -0,0 +1,27 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from projects.models import Project
+from tasks.models import Task, update_tasks_stream_state
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild label stream state of tasks (stream annotation counters and ground truth flag) from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='project id, all projects are rebuilt if not specified')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.order_by('id')
+        if options['project']:
+            projects = projects.filter(id=options['project'])
+
+        for project_id in projects.values_list('id', flat=True):
+            logger.debug(f'Start rebuilding stream state for project {project_id}.')
+            task_ids = list(Task.objects.filter(project_id=project_id).values_list('id', flat=True))
+            for i in range(0, len(task_ids), settings.BATCH_SIZE):
+                update_tasks_stream_state(Task.objects.filter(id__in=task_ids[i : i + settings.BATCH_SIZE]))
+            self.stdout.write(f'Project {project_id}: stream state rebuilt for {len(task_ids)} tasks')
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0054_add_brin_index_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="stream_finished_annotations",
+            field=models.IntegerField(
+                db_default=0,
+                default=0,
+                help_text="Number of not cancelled annotations except ground truth, used by the label stream",
+                verbose_name="stream finished annotations",
+            ),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="stream_skipped_annotations",
+            field=models.IntegerField(
+                db_default=0,
+                default=0,
+                help_text="Number of cancelled annotations except ground truth, used by the label stream",
+                verbose_name="stream skipped annotations",
+            ),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="has_ground_truth",
+            field=models.BooleanField(
+                db_default=False,
+                default=False,
+                help_text="Task has at least one ground truth annotation, used by the label stream",
+                verbose_name="has ground truth",
+            ),
+        ),
+    ]
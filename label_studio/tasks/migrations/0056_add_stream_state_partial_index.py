@@ -0,0 +1,73 @@
+from django.db import migrations, connection
+from core.redis import start_job_async_or_sync
+from core.models import AsyncMigrationStatus
+import logging
+
+logger = logging.getLogger(__name__)
+
+migration_name = '0056_add_stream_state_partial_index'
+
+def forward_migration(migration_name):
+    migration = AsyncMigrationStatus.objects.create(
+        name=migration_name,
+        status=AsyncMigrationStatus.STATUS_STARTED,
+    )
+    logger.debug(f'Start async migration {migration_name}')
+
+    # Partial index over not labeled tasks only, it's used by the label stream to filter eligible tasks
+    if connection.vendor == 'postgresql':
+        sql = '''
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "task_stream_state_idx"
+        ON "task" ("project_id", "stream_finished_annotations", "stream_skipped_annotations")
+        WHERE NOT "is_labeled";
+        '''
+    else:
+        sql = '''
+        CREATE INDEX IF NOT EXISTS "task_stream_state_idx"
+        ON "task" ("project_id", "stream_finished_annotations", "stream_skipped_annotations")
+        WHERE NOT "is_labeled";
+        '''
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+
+    migration.status = AsyncMigrationStatus.STATUS_FINISHED
+    migration.save()
+    logger.debug(f'Async migration {migration_name} complete')
+
+def reverse_migration(migration_name):
+    migration = AsyncMigrationStatus.objects.create(
+        name=migration_name,
+        status=AsyncMigrationStatus.STATUS_STARTED,
+    )
+    logger.debug(f'Start async migration rollback {migration_name}')
+
+    if connection.vendor == 'postgresql':
+        sql = 'DROP INDEX CONCURRENTLY IF EXISTS "task_stream_state_idx";'
+    else:
+        sql = 'DROP INDEX IF EXISTS "task_stream_state_idx";'
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+
+    migration.status = AsyncMigrationStatus.STATUS_FINISHED
+    migration.save()
+    logger.debug(f'Async migration rollback {migration_name} complete')
+
+def forwards(apps, schema_editor):
+    start_job_async_or_sync(forward_migration, migration_name=migration_name)
+
+def backwards(apps, schema_editor):
+    start_job_async_or_sync(reverse_migration, migration_name=migration_name)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("tasks", "0055_task_stream_state"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
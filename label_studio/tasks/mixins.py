@@ -27,9 +27,6 @@ class TaskMixin:
         """
         pass
 
-    def get_rejected_query(self):
-        pass
-
 
 class AnnotationMixin:
     def has_permission(self, user: 'User') -> bool:  # noqa: F821
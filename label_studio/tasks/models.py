@@ -1,7 +1,6 @@
 """This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
 """
 import base64
-import datetime
 import logging
 import numbers
 import os
@@ -29,17 +28,18 @@ from data_import.models import FileUpload
 from data_manager.managers import PreparedTaskManager, TaskManager
 from django.conf import settings
 from django.db import OperationalError, models, transaction
-from django.db.models import CheckConstraint, F, JSONField, Q
+from django.db.models import CheckConstraint, Count, Exists, F, JSONField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.db.models.lookups import GreaterThanOrEqual
 from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import Signal, receiver
 from django.urls import reverse
 from django.utils.timesince import timesince
-from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from label_studio_sdk.label_interface.objects import PredictionValue
 from rest_framework.exceptions import ValidationError
 from tasks.choices import ActionType
+from tasks.locks import get_task_lock_backend
 
 logger = logging.getLogger(__name__)
 
@@ -135,6 +135,25 @@ class Task(TaskMixin, models.Model):
         help_text='Number of total predictions for the current task',
     )
 
+    stream_finished_annotations = models.IntegerField(
+        _('stream finished annotations'),
+        default=0,
+        db_default=0,
+        help_text='Number of not cancelled annotations except ground truth, used by the label stream',
+    )
+    stream_skipped_annotations = models.IntegerField(
+        _('stream skipped annotations'),
+        default=0,
+        db_default=0,
+        help_text='Number of cancelled annotations except ground truth, used by the label stream',
+    )
+    has_ground_truth = models.BooleanField(
+        _('has ground truth'),
+        default=False,
+        db_default=False,
+        help_text='Task has at least one ground truth annotation, used by the label stream',
+    )
+
     comment_count = models.IntegerField(
         _('comment count'),
         default=0,
@@ -195,18 +214,12 @@ class Task(TaskMixin, models.Model):
     @classmethod
     def get_locked_by(cls, user, project=None, tasks=None):
         """Retrieve the task locked by specified user. Returns None if the specified user didn't lock anything."""
-        lock = None
         if project is not None:
-            lock = fast_first(TaskLock.objects.filter(user=user, expire_at__gt=now(), task__project=project))
-        elif tasks is not None:
-            locked_task = fast_first(tasks.filter(locks__user=user, locks__expire_at__gt=now()))
-            if locked_task:
-                return locked_task
-        else:
+            tasks = cls.objects.filter(project=project)
+        elif tasks is None:
             raise Exception('Neither project or tasks passed to get_locked_by')
 
-        if lock:
-            return lock.task
+        return fast_first(get_task_lock_backend().get_locked_tasks(user, tasks))
 
     def get_predictions_for_prelabeling(self):
         """This is called to return either new predictions from the
@@ -242,31 +255,7 @@ class Task(TaskMixin, models.Model):
         """
         Get query for excluding annotations from the lock check
         """
-        SkipQueue = self.project.SkipQueue
-
-        if self.project.skip_queue == SkipQueue.IGNORE_SKIPPED:
-            # IGNORE_SKIPPED: my skipped tasks don't go anywhere
-            # alien's and my skipped annotations are counted as regular annotations
-            q = Q()
-        else:
-            if self.project.skip_queue == SkipQueue.REQUEUE_FOR_ME:
-                # REQUEUE_FOR_ME means: only my skipped tasks go back to me,
-                # alien's skipped annotations are counted as regular annotations
-                q = Q(was_cancelled=True) & Q(completed_by=user)
-            elif self.project.skip_queue == SkipQueue.REQUEUE_FOR_OTHERS:
-                # REQUEUE_FOR_OTHERS: my skipped tasks go to others
-                # alien's skipped annotations are not counted at all
-                q = Q(was_cancelled=True) & ~Q(completed_by=user)
-            else:
-                raise Exception(f'Invalid SkipQueue value: {self.project.skip_queue}')
-
-            # for LSE we also need to exclude rejected queue
-            rejected_q = self.get_rejected_query()
-
-            if rejected_q:
-                q &= rejected_q
-
-        return q | Q(ground_truth=True)
+        return self.project.get_lock_exclude_query(user)
 
     def has_lock(self, user=None):
         """
@@ -292,20 +281,7 @@ class Task(TaskMixin, models.Model):
         num = num_locks + num_annotations
 
         if num > self.overlap_with_agreement_threshold(num, num_locks):
-            logger.error(
-                f'Num takes={num} > overlap={self.overlap} for task={self.id}, '
-                f"skipped mode {self.project.skip_queue} - it's a bug",
-                extra=dict(
-                    lock_ttl=self.locks.values_list('user', 'expire_at'),
-                    num_locks=num_locks,
-                    num_annotations=num_annotations,
-                ),
-            )
-            # TODO: remove this workaround after fixing the bug with inconsistent is_labeled flag
-            if self.is_labeled is False:
-                self.update_is_labeled()
-                if self.is_labeled is True:
-                    self.save(update_fields=['is_labeled'])
+            self.fix_is_labeled_on_overflow(num_locks, num_annotations)
 
         result = bool(num >= self.overlap_with_agreement_threshold(num, num_locks))
         logger.log(
@@ -315,9 +291,26 @@ class Task(TaskMixin, models.Model):
         )
         return result
 
+    def fix_is_labeled_on_overflow(self, num_locks, num_annotations):
+        """Called when the task is taken more times than its overlap allows"""
+        logger.error(
+            f'Num takes={num_locks + num_annotations} > overlap={self.overlap} for task={self.id}, '
+            f"skipped mode {self.project.skip_queue} - it's a bug",
+            extra=dict(
+                lock_ttl=get_task_lock_backend().get_locks(self),
+                num_locks=num_locks,
+                num_annotations=num_annotations,
+            ),
+        )
+        # TODO: remove this workaround after fixing the bug with inconsistent is_labeled flag
+        if self.is_labeled is False:
+            self.update_is_labeled()
+            if self.is_labeled is True:
+                self.save(update_fields=['is_labeled'])
+
     @property
     def num_locks(self):
-        return self.locks.filter(expire_at__gt=now()).count()
+        return get_task_lock_backend().num_locks(self)
 
     def overlap_with_agreement_threshold(self, num, num_locks):
         # Limit to one extra annotator at a time when the task is under the threshold and meets the overlap criteria,
@@ -343,7 +336,10 @@ class Task(TaskMixin, models.Model):
         return self.overlap
 
     def num_locks_user(self, user):
-        return self.locks.filter(expire_at__gt=now()).exclude(user=user).count()
+        return get_task_lock_backend().num_locks(self, exclude_user=user)
+
+    def get_lock_unique_id(self, user):
+        return get_task_lock_backend().get_unique_id(self, user)
 
     def get_storage_filename(self):
         for link_name in settings.IO_STORAGES_IMPORT_LINK_NAMES:
@@ -357,49 +353,40 @@ class Task(TaskMixin, models.Model):
         return mixin_has_permission and self.project.has_permission(user)
 
     def clear_expired_locks(self):
-        self.locks.filter(expire_at__lt=now()).delete()
+        get_task_lock_backend().clear_expired(self)
 
     def set_lock(self, user):
         """Lock current task by specified user. Lock lifetime is set by `expire_in_secs`"""
         from projects.functions.next_task import get_next_task_logging_level
 
-        num_locks = self.num_locks
-        if num_locks < self.overlap:
-            lock_ttl = settings.TASK_LOCK_TTL
-            if (
-                flag_set('fflag_feat_all_leap_1534_custom_task_lock_timeout_short', user=user)
-                and self.project.custom_task_lock_ttl
-            ):
-                lock_ttl = self.project.custom_task_lock_ttl
-            expire_at = now() + datetime.timedelta(seconds=lock_ttl)
-            try:
-                task_lock = TaskLock.objects.get(task=self, user=user)
-            except TaskLock.DoesNotExist:
-                TaskLock.objects.create(task=self, user=user, expire_at=expire_at)
-            else:
-                task_lock.expire_at = expire_at
-                task_lock.save()
+        backend = get_task_lock_backend()
+        lock_ttl = settings.TASK_LOCK_TTL
+        if (
+            flag_set('fflag_feat_all_leap_1534_custom_task_lock_timeout_short', user=user)
+            and self.project.custom_task_lock_ttl
+        ):
+            lock_ttl = self.project.custom_task_lock_ttl
+
+        if backend.acquire(self, user, lock_ttl):
             logger.log(
                 get_next_task_logging_level(user),
                 f'User={user} acquires a lock for the task={self} ttl: {lock_ttl}',
             )
         else:
             logger.error(
-                f'Current number of locks for task {self.id} is {num_locks}, but overlap={self.overlap}: '
+                f'Current number of locks for task {self.id} is {backend.num_locks(self)}, but overlap={self.overlap}: '
                 f"that's a bug because this task should not be taken in a label stream (task should be locked)"
             )
-        self.clear_expired_locks()
+        backend.clear_expired(self)
 
     def release_lock(self, user=None):
         """Release lock for the task.
         If user specified, it checks whether lock is released by the user who previously has locked that task
         """
 
-        if user is not None:
-            self.locks.filter(user=user).delete()
-        else:
-            self.locks.all().delete()
-        self.clear_expired_locks()
+        backend = get_task_lock_backend()
+        backend.release(self, user)
+        backend.clear_expired(self)
 
     def get_storage_link(self):
         # TODO: how to get neatly any storage class here?
@@ -515,6 +502,19 @@ class Task(TaskMixin, models.Model):
             summary = self.project.summary
             summary.remove_data_columns([self])
 
+    def update_stream_state(self, save=True):
+        """Recount label stream eligibility state: annotations per skip queue mode and ground truth"""
+        state = self.annotations.aggregate(**STREAM_STATE_AGGREGATES)
+        self.stream_finished_annotations = state['stream_finished_annotations']
+        self.stream_skipped_annotations = state['stream_skipped_annotations']
+        self.has_ground_truth = state['has_ground_truth'] > 0
+        if save:
+            Task.objects.filter(id=self.id).update(
+                stream_finished_annotations=self.stream_finished_annotations,
+                stream_skipped_annotations=self.stream_skipped_annotations,
+                has_ground_truth=self.has_ground_truth,
+            )
+
     def ensure_unique_groundtruth(self, annotation_id):
         self.annotations.exclude(id=annotation_id).update(ground_truth=False)
 
@@ -790,6 +790,7 @@ class Annotation(AnnotationMixin, models.Model):
         logger.debug(f'Update task stats for task={task}')
         task.update_is_labeled()
         Task.objects.filter(id=task.id).update(is_labeled=task.is_labeled)
+        task.update_stream_state()
 
         # remove annotation counters in project summary followed by deleting an annotation
         logger.debug('Remove annotation counters in project summary followed by deleting an annotation')
@@ -1304,7 +1305,17 @@ def update_project_summary_annotations_and_is_labeled(sender, instance, created,
     else:
         instance.task.total_annotations = instance.task.annotations.all().filter(was_cancelled=False).count()
     instance.task.update_is_labeled()
-    instance.task.save(update_fields=['is_labeled', 'total_annotations', 'cancelled_annotations'])
+    instance.task.update_stream_state(save=False)
+    instance.task.save(
+        update_fields=[
+            'is_labeled',
+            'total_annotations',
+            'cancelled_annotations',
+            'stream_finished_annotations',
+            'stream_skipped_annotations',
+            'has_ground_truth',
+        ]
+    )
     logger.debug(f'Updated total_annotations and cancelled_annotations for {instance.task.id}.')
 
 
@@ -1394,6 +1405,11 @@ def bulk_update_stats_project_tasks(tasks, project=None):
         project = tasks[0].project
 
     with transaction.atomic():
+        if isinstance(tasks, models.QuerySet):
+            update_tasks_stream_state(tasks)
+        else:
+            update_tasks_stream_state(Task.objects.filter(id__in=[task.id for task in tasks]))
+
         use_overlap = project._can_use_overlap()
         # update filters if we can use overlap
         if use_overlap:
@@ -1427,4 +1443,34 @@ def bulk_update_stats_project_tasks(tasks, project=None):
 
 
 Q_finished_annotations = Q(was_cancelled=False) & Q(result__isnull=False)
+
+# label stream eligibility state of the task, see Task.update_stream_state()
+STREAM_STATE_AGGREGATES = {
+    'stream_finished_annotations': Count('id', filter=Q(was_cancelled=False, ground_truth=False)),
+    'stream_skipped_annotations': Count('id', filter=Q(was_cancelled=True, ground_truth=False)),
+    'has_ground_truth': Count('id', filter=Q(ground_truth=True)),
+}
+# internal label stream bookkeeping, not exposed in API and exports
+STREAM_STATE_FIELDS = tuple(STREAM_STATE_AGGREGATES)
+
+
+def update_tasks_stream_state(tasks):
+    """Recount label stream eligibility state for the tasks queryset with one UPDATE query"""
+
+    def _count(q):
+        annotations = (
+            Annotation.objects.filter(q, task=OuterRef('pk'))
+            .order_by()
+            .values('task')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        return Coalesce(Subquery(annotations, output_field=models.IntegerField()), 0)
+
+    return Task.objects.filter(id__in=tasks.values('id')).update(
+        stream_finished_annotations=_count(Q(was_cancelled=False, ground_truth=False)),
+        stream_skipped_annotations=_count(Q(was_cancelled=True, ground_truth=False)),
+        has_ground_truth=Exists(Annotation.objects.filter(task=OuterRef('pk'), ground_truth=True)),
+    )
+
 Q_task_finished_annotations = Q(annotations__was_cancelled=False) & Q(annotations__result__isnull=False)
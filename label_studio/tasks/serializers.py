@@ -18,7 +18,7 @@ from rest_framework.fields import SkipField
 from rest_framework.serializers import ModelSerializer
 from rest_framework.settings import api_settings
 from tasks.exceptions import AnnotationDuplicateError
-from tasks.models import Annotation, AnnotationDraft, Prediction, PredictionMeta, Task
+from tasks.models import STREAM_STATE_FIELDS, Annotation, AnnotationDraft, Prediction, PredictionMeta, Task
 from tasks.validation import TaskValidator
 from users.models import User
 from users.serializers import UserSerializer
@@ -155,7 +155,7 @@ class TaskSimpleSerializer(ModelSerializer):
 
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = STREAM_STATE_FIELDS
 
 
 class BaseTaskSerializer(FlexFieldsModelSerializer):
@@ -197,7 +197,7 @@ class BaseTaskSerializer(FlexFieldsModelSerializer):
 
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = STREAM_STATE_FIELDS
 
 
 class BaseTaskSerializerBulk(serializers.ListSerializer):
@@ -600,7 +600,7 @@ class BaseTaskSerializerBulk(serializers.ListSerializer):
 
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = STREAM_STATE_FIELDS
 
 
 TaskSerializer = load_func(settings.TASK_SERIALIZER)
@@ -617,7 +617,7 @@ class TaskWithAnnotationsSerializer(TaskSerializer):
         model = Task
         list_serializer_class = load_func(settings.TASK_SERIALIZER_BULK)
 
-        exclude = ()
+        exclude = STREAM_STATE_FIELDS
 
 
 class AnnotationDraftSerializer(ModelSerializer):
@@ -698,9 +698,7 @@ class NextTaskSerializer(TaskWithAnnotationsAndPredictionsAndDraftsSerializer):
 
     def get_unique_lock_id(self, task):
         user = self.context['request'].user
-        lock = task.locks.filter(user=user).first()
-        if lock:
-            return lock.unique_id
+        return task.get_lock_unique_id(user)
 
     def get_predictions(self, task):
         predictions = task.get_predictions_for_prelabeling()
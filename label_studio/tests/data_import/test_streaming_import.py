@@ -0,0 +1,87 @@
+import json
+from unittest import mock
+
+import pytest
+from data_import import functions
+from data_import.functions import async_import_background
+from data_import.models import FileUpload
+from django.core.files.base import ContentFile
+from projects.models import ProjectImport
+from projects.tests.factories import ProjectFactory
+from rest_framework.exceptions import ValidationError
+
+pytestmark = pytest.mark.django_db
+
+LABEL_CONFIG = '<View><Text name="text" value="$text"/><Choices name="label" toName="text"><Choice value="pos"/></Choices></View>'
+
+
+def _tasks_file(tasks):
+    return [
+        {'data': {'text': f'text {i}', 'score': i / 10}} if i % 2 else {'text': f'text {i}', 'score': i / 10}
+        for i in range(tasks)
+    ]
+
+
+def _import(settings, chunk_size, files, **import_params):
+    settings.IMPORT_STREAMING_CHUNK_SIZE = chunk_size
+    project = ProjectFactory(label_config=LABEL_CONFIG)
+    user = project.created_by
+    file_upload_ids = []
+    for name, content in files:
+        file_upload = FileUpload(user=user, project=project)
+        file_upload.file.save(name, ContentFile(json.dumps(content).encode()))
+        file_upload_ids.append(file_upload.id)
+    project_import = ProjectImport.objects.create(
+        project=project, file_upload_ids=file_upload_ids, commit_to_project=True, **import_params
+    )
+    async_import_background(project_import.id, user.id)
+    project_import.refresh_from_db()
+    return project, project_import
+
+
+def test_streaming_import_matches_import(settings):
+    files = [('tasks.json', _tasks_file(25)), ('task.json', {'text': 'single task', 'score': 0.5})]
+    imports = []
+    with mock.patch.object(functions, '_import_tasks_chunk', wraps=functions._import_tasks_chunk) as chunks:
+        for chunk_size in (0, 10):
+            imports.append(_import(settings, chunk_size, files, return_task_ids=True))
+    assert chunks.call_count == 3
+
+    results = []
+    for project, project_import in imports:
+        assert project_import.status == ProjectImport.Status.COMPLETED
+        assert project_import.task_ids == list(project.tasks.order_by('id').values_list('id', flat=True))
+        results.append(
+            (
+                [(task.data, task.file_upload.file_name[9:]) for task in project.tasks.order_by('id')],
+                project_import.task_count,
+                project_import.found_formats,
+                sorted(project_import.data_columns),
+                project.summary.all_data_columns,
+            )
+        )
+    assert results[1] == results[0]
+    assert results[1][1] == 26
+    assert results[1][0][3] == ({'text': 'text 3', 'score': 0.3}, 'tasks.json')
+
+
+def test_streaming_import_with_predictions_from_fields(settings):
+    result = [{'from_name': 'label', 'to_name': 'text', 'type': 'choices', 'value': {'choices': ['pos']}}]
+    tasks = [{'text': f'text {i}', 'label': result} for i in range(5)]
+    project, project_import = _import(settings, 2, [('tasks.json', tasks)], preannotated_from_fields=['label'])
+
+    assert project_import.status == ProjectImport.Status.COMPLETED
+    assert (project_import.task_count, project_import.prediction_count) == (5, 5)
+    assert project.tasks.filter(predictions__isnull=False).count() == 5
+    assert project.tasks.first().data == {'text': 'text 0'}
+
+
+def test_streaming_import_keeps_saved_chunks_on_error(settings):
+    tasks = _tasks_file(15) + ['not a task']
+
+    with pytest.raises(ValidationError):
+        _import(settings, 10, [('tasks.json', tasks)])
+
+    project_import = ProjectImport.objects.get()
+    assert project_import.task_count == 10
+    assert project_import.project.tasks.count() == 10
@@ -1,11 +1,21 @@
 """This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
 """
+import hashlib
 import json
+import os
 
+import mock
 import pytest
+from data_export.mixins import set_export_background_failure
+from data_export.models import Export
+from data_import.models import FileUpload
 from django.apps import apps
+from projects.tests.factories import ProjectFactory
+from tasks.functions import export_project
 from tasks.models import Annotation, Prediction, Task
 from tasks.serializers import AnnotationSerializer
+from tasks.tests.factories import AnnotationDraftFactory, AnnotationFactory, PredictionFactory, TaskFactory
+from users.tests.factories import UserFactory
 
 
 @pytest.mark.skip(reason='HTX-868')
@@ -318,3 +328,145 @@ def test_export_with_predictions(
             assert task['predictions'][0]['score'] == predictions['score']
         else:
             assert task['predictions'] == []
+
+
+@pytest.mark.parametrize('workers', (0, 2))
+@pytest.mark.django_db(transaction=True)
+def test_export_to_file_streams_same_data(settings, workers):
+    settings.EXPORT_SERIALIZATION_WORKERS = workers
+    project = ProjectFactory()
+    tasks = Task.objects.bulk_create(
+        [Task(project=project, data={'text': f'текст {i}', 'image': f'http://ggg.com/{i}.jpg'}) for i in range(2100)]
+    )
+    for task in tasks[:3]:
+        AnnotationFactory(task=task, project=project, result=[{'value': {'choices': ['class_A']}}])
+
+    export = Export.objects.create(project=project, created_by=project.created_by)
+    export.export_to_file()
+    export.refresh_from_db()
+    assert export.status == Export.Status.COMPLETED
+
+    with export.file.open('rb') as f:
+        content = f.read()
+    assert export.md5 == hashlib.md5(content).hexdigest()   # nosec
+    assert json.loads(content) == json.loads(json.dumps(list(export.get_export_data())))
+    assert len(json.loads(content)) == 2100
+
+
+@pytest.fixture
+def project_for_raw_export():
+    project = ProjectFactory(label_config='<View><Text name="text" value="$text"/></View>')
+    users = [project.created_by, UserFactory()]
+    file_upload = FileUpload.objects.create(user=users[0], project=project, file='upload/1/tasks.json')
+    tasks = [
+        TaskFactory(project=project, file_upload=file_upload, meta={'source': 'file'}),
+        TaskFactory(project=project, data={'$undefined$': 'undefined key'}),
+        TaskFactory(project=project),
+    ]
+    AnnotationFactory(task=tasks[0], project=project, completed_by=users[1], lead_time=1, updated_by=users[0])
+    AnnotationFactory(task=tasks[0], project=project, completed_by=users[0], ground_truth=True, result=[])
+    AnnotationFactory(task=tasks[1], project=project, completed_by=users[0], was_cancelled=True, lead_time=2.5)
+    PredictionFactory(task=tasks[0], score=0.5)
+    PredictionFactory(task=tasks[0])
+    AnnotationDraftFactory(task=tasks[1], user=users[1])
+    tasks[0].comment_authors.add(users[1], users[0])
+    return project
+
+
+@pytest.mark.parametrize(
+    'task_filter_options, annotation_filter_options, serialization_options',
+    [
+        (None, None, None),
+        ({'only_with_annotations': True}, {'usual': True, 'ground_truth': True}, None),
+        ({'skipped': 'exclude'}, {'skipped': True}, {'annotations__completed_by': {'only_id': False}}),
+        (None, None, {'drafts': {'only_id': True}, 'predictions': {'only_id': True}, 'interpolate_key_frames': True}),
+    ],
+)
+@pytest.mark.django_db
+def test_raw_export_matches_serializer(
+    settings, project_for_raw_export, task_filter_options, annotation_filter_options, serialization_options
+):
+    export = Export(project=project_for_raw_export)
+    exported = []
+    for raw in (False, True):
+        settings.EXPORT_RAW_SERIALIZATION = raw
+        tasks = export.get_export_data(task_filter_options, annotation_filter_options, serialization_options)
+        exported.append(json.dumps(list(tasks)))
+
+    assert exported[1] == exported[0]
+    assert json.loads(exported[1])
+
+
+@pytest.mark.django_db
+def test_export_project_raw_matches_serializer(settings, tmp_path, project_for_raw_export):
+    exported = []
+    for raw in (False, True):
+        settings.EXPORT_RAW_SERIALIZATION = raw
+        path = export_project(project_for_raw_export.id, 'JSON', str(tmp_path / f'{raw}.json'))
+        with open(path) as f:
+            exported.append(f.read())
+
+    assert exported[1] == exported[0]
+
+
+@pytest.mark.django_db
+def test_export_to_file_resumes_from_checkpoint(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    project = ProjectFactory()
+    tasks = Task.objects.bulk_create([Task(project=project, data={'text': f'text {i}'}) for i in range(2500)])
+    AnnotationFactory(task=tasks[1500], project=project)
+    export = Export.objects.create(project=project, created_by=project.created_by)
+
+    exported_task_ids = []
+    iter_task_batches = Export._iter_task_batches
+
+    def fail_after_first_batch(self, *args, fail=True, **kwargs):
+        for i, (ids, *batch) in enumerate(iter_task_batches(self, *args, **kwargs)):
+            if fail and i == 1:
+                raise RuntimeError('worker restarted')
+            exported_task_ids.extend(ids)
+            yield (ids, *batch)
+
+    with mock.patch.object(Export, '_iter_task_batches', fail_after_first_batch):
+        with pytest.raises(RuntimeError):
+            export.export_to_file(raise_exception=True)
+        export.refresh_from_db()
+        assert export.status == Export.Status.CREATED
+        assert (export.checkpoint_task_id, export.chunks) == (tasks[999].id, 1)
+        assert export.counters == {'task_number': 1000}
+
+        # resumed run fails after one more chunk
+        export.export_to_file()
+        export.refresh_from_db()
+        assert export.status == Export.Status.FAILED
+        assert (export.checkpoint_task_id, export.chunks) == (tasks[1999].id, 2)
+
+    with mock.patch.object(
+        Export, '_iter_task_batches', lambda *args, **kwargs: fail_after_first_batch(*args, fail=False, **kwargs)
+    ):
+        export.export_to_file()
+    export.refresh_from_db()
+    assert export.status == Export.Status.COMPLETED
+    assert exported_task_ids == [task.id for task in tasks]
+    assert (export.checkpoint_task_id, export.chunks) == (None, 0)
+    assert export.counters == {'task_number': 2500}
+
+    with export.file.open('rb') as f:
+        content = f.read()
+    assert export.md5 == hashlib.md5(content).hexdigest()   # nosec
+    assert json.loads(content) == json.loads(json.dumps(list(export.get_export_data())))
+    assert sorted(p.name for p in (tmp_path / settings.DELAYED_EXPORT_DIR / str(project.id)).iterdir()) == [
+        os.path.basename(export.file.name)
+    ]
+
+
+@pytest.mark.parametrize('retries_left, status', ((2, Export.Status.IN_PROGRESS), (0, Export.Status.FAILED)))
+@pytest.mark.django_db
+def test_export_background_failure_waits_for_retries(retries_left, status):
+    project = ProjectFactory()
+    export = Export.objects.create(project=project, status=Export.Status.IN_PROGRESS)
+    job = mock.Mock(args=[export.id], retries_left=retries_left)
+
+    set_export_background_failure(job, None, RuntimeError, RuntimeError(), None)
+    export.refresh_from_db()
+    assert export.status == status
@@ -7,7 +7,10 @@ from unittest import mock
 import pytest
 from core.redis import redis_healthcheck
 from django.apps import apps
+from django.db import connection
 from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from projects.functions.next_task import get_next_task
 from projects.models import Project
 from tasks.models import Annotation, Prediction, Task
 
@@ -1327,3 +1330,59 @@ def test_overlap_first(business_client, setup_before_upload, show_overlap_first)
     else:
         assert not all_tasks_with_overlap_are_labeled
         assert not all_tasks_without_overlap_are_not_labeled
+
+
+
+def _make_locked_project(business_client, num_locked, sampling=Project.SEQUENCE):
+    project = make_project(
+        dict(title='test_next_task_single_query', is_published=True, maximum_annotations=1, sampling=sampling),
+        business_client.user,
+        use_ml_backend=False,
+    )
+    collaborator = make_annotator({'email': f'locker{num_locked}{sampling}@testnexttaskquery.com'}, project)
+    for i in range(num_locked):
+        make_task({'data': {'text': f'locked {i}'}}, project).set_lock(collaborator)
+    annotated = make_task({'data': {'text': 'annotated'}}, project)
+    make_annotation({'result': [], 'completed_by': collaborator}, annotated.id)
+    expected = make_task({'data': {'text': 'free'}}, project)
+    return project, expected
+
+
+@pytest.mark.parametrize('single_query', (True, False))
+@pytest.mark.django_db
+def test_next_task_single_query_selects_same_task(business_client, settings, single_query):
+    settings.NEXT_TASK_SINGLE_QUERY_ENABLED = single_query
+    project, expected = _make_locked_project(business_client, num_locked=3)
+
+    r = business_client.get(f'/api/projects/{project.id}/next')
+    assert r.status_code == 200
+    assert json.loads(r.content)['id'] == expected.id
+
+
+@pytest.mark.parametrize('sampling', (Project.SEQUENCE, Project.UNIFORM, Project.UNCERTAINTY))
+@pytest.mark.django_db
+def test_next_task_single_query_count_does_not_grow_with_locked_tasks(business_client, sampling):
+    num_queries = []
+    for num_locked in (2, 20):
+        project, expected = _make_locked_project(business_client, num_locked, sampling)
+        with CaptureQueriesContext(connection) as queries:
+            next_task, _ = get_next_task(business_client.user, project.tasks.order_by('id'), project, dm_queue=False)
+        assert next_task.id == expected.id
+        num_queries.append(len(queries))
+
+    assert num_queries[0] == num_queries[1]
+
+
+@pytest.mark.django_db
+def test_next_task_single_query_fixes_overflowed_is_labeled(business_client):
+    project, expected = _make_locked_project(business_client, num_locked=0)
+    # the annotated task has inconsistent is_labeled flag, it must be fixed while selecting the next task
+    overflowed = project.tasks.get(data__text='annotated')
+    another_annotator = make_annotator({'email': 'another@testnexttaskquery.com'}, project)
+    make_annotation({'result': [], 'completed_by': another_annotator}, overflowed.id)
+    Task.objects.filter(id=overflowed.id).update(is_labeled=False)
+
+    next_task, _ = get_next_task(business_client.user, project.tasks.order_by('id'), project, dm_queue=False)
+    assert next_task.id == expected.id
+    overflowed.refresh_from_db()
+    assert overflowed.is_labeled
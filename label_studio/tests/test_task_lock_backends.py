@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from fakeredis import FakeRedis
+from tasks.locks import DatabaseTaskLockBackend, RedisTaskLockBackend, get_task_lock_backend
+from tasks.models import Task
+
+from .utils import make_annotator, make_project, make_task
+
+
+@pytest.fixture
+def redis_locks(settings):
+    settings.TASK_LOCK_BACKEND = 'redis'
+    with mock.patch('tasks.locks.get_redis_connection', return_value=FakeRedis()) as connection:
+        yield connection
+
+
+def test_redis_backend_falls_back_to_database(settings):
+    settings.TASK_LOCK_BACKEND = 'redis'
+    with mock.patch('tasks.locks.get_redis_connection', return_value=None):
+        assert isinstance(get_task_lock_backend(), DatabaseTaskLockBackend)
+
+    with mock.patch('tasks.locks.get_redis_connection', return_value=FakeRedis()):
+        assert isinstance(get_task_lock_backend(), RedisTaskLockBackend)
+
+
+def test_redis_backend_annotators_race_for_tasks():
+    backend = RedisTaskLockBackend(FakeRedis())
+    tasks = [SimpleNamespace(id=task_id, overlap=2) for task_id in range(1, 6)]
+    annotators = [SimpleNamespace(id=user_id) for user_id in range(1, 51)]
+
+    def take_tasks(annotator):
+        return [task.id for task in tasks if backend.acquire(task, annotator, ttl=60)]
+
+    with ThreadPoolExecutor(max_workers=len(annotators)) as executor:
+        taken = [task_id for task_ids in executor.map(take_tasks, annotators) for task_id in task_ids]
+
+    for task in tasks:
+        assert taken.count(task.id) == task.overlap
+        assert backend.num_locks(task) == task.overlap
+
+
+def test_redis_backend_lock_lifecycle():
+    backend = RedisTaskLockBackend(FakeRedis())
+    task = SimpleNamespace(id=1, overlap=1)
+    annotator, another_annotator = SimpleNamespace(id=1), SimpleNamespace(id=2)
+
+    assert backend.acquire(task, annotator, ttl=60)
+    unique_id = backend.get_unique_id(task, annotator)
+    # the same annotator prolongs their lock and keeps its id, others can't take the task
+    assert backend.acquire(task, annotator, ttl=60)
+    assert backend.get_unique_id(task, annotator) == unique_id
+    assert not backend.acquire(task, another_annotator, ttl=60)
+    assert backend.num_locks(task, exclude_user=annotator) == 0
+
+    backend.release(task, annotator)
+    assert backend.num_locks(task) == 0
+    assert backend.acquire(task, another_annotator, ttl=60)
+
+
+@pytest.mark.django_db
+def test_redis_backend_task_locks(business_client, redis_locks):
+    project = make_project({}, business_client.user, use_ml_backend=False)
+    annotator = make_annotator({'email': 'annotator@testtasklockbackends.com'}, project)
+    task = make_task({'data': {'text': 'text'}}, project)
+
+    task.set_lock(annotator)
+    assert task.num_locks == 1
+    assert task.num_locks_user(business_client.user) == 1
+    assert task.has_lock(business_client.user)
+    assert not task.has_lock(annotator)
+    assert task.get_lock_unique_id(annotator) is not None
+    assert Task.get_locked_by(annotator, project=project) == task
+    # locks are not written to the database
+    assert not task.locks.exists()
+
+    task.release_lock(annotator)
+    assert task.num_locks == 0
+    assert Task.get_locked_by(annotator, project=project) is None
+
+
+@pytest.mark.django_db
+def test_next_task_skips_tasks_locked_in_redis(business_client, redis_locks):
+    project = make_project(
+        dict(title='test_redis_locks', is_published=True, maximum_annotations=1), business_client.user, False
+    )
+    annotator = make_annotator({'email': 'annotator@testtasklockbackends.com'}, project)
+    locked = make_task({'data': {'text': 'locked'}}, project)
+    free = make_task({'data': {'text': 'free'}}, project)
+    locked.set_lock(annotator)
+
+    r = business_client.get(f'/api/projects/{project.id}/next')
+    assert r.status_code == 200
+    assert r.json()['id'] == free.id
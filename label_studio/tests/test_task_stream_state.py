@@ -0,0 +1,78 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from projects.models import Project
+from tasks.models import Task, bulk_update_stats_project_tasks
+
+from .utils import make_annotation, make_annotator, make_project, make_task
+
+
+def _stream_state(task):
+    task.refresh_from_db()
+    return task.stream_finished_annotations, task.stream_skipped_annotations, task.has_ground_truth
+
+
+@pytest.mark.django_db
+def test_stream_state_follows_annotation_changes(business_client):
+    project = make_project({}, business_client.user, use_ml_backend=False)
+    task = make_task({'data': {'text': 'text'}}, project)
+
+    annotation = make_annotation({'result': [], 'completed_by': business_client.user}, task.id)
+    assert _stream_state(task) == (1, 0, False)
+
+    annotation.was_cancelled = True
+    annotation.save()
+    assert _stream_state(task) == (0, 1, False)
+
+    ground_truth = make_annotation({'result': [], 'completed_by': business_client.user, 'ground_truth': True}, task.id)
+    assert _stream_state(task) == (0, 1, True)
+
+    ground_truth.delete()
+    annotation.delete()
+    assert _stream_state(task) == (0, 0, False)
+
+
+@pytest.mark.django_db
+def test_stream_state_rebuild(business_client):
+    project = make_project({}, business_client.user, use_ml_backend=False)
+    task = make_task({'data': {'text': 'text'}}, project)
+    make_annotation({'result': [], 'completed_by': business_client.user}, task.id)
+    make_annotation({'result': [], 'completed_by': business_client.user, 'was_cancelled': True}, task.id)
+
+    Task.objects.filter(id=task.id).update(stream_finished_annotations=0, stream_skipped_annotations=0)
+    bulk_update_stats_project_tasks(project.tasks.all(), project)
+    assert _stream_state(task) == (1, 1, False)
+
+    Task.objects.filter(id=task.id).update(stream_finished_annotations=0, stream_skipped_annotations=0)
+    call_command('rebuild_task_stream_state', project=project.id)
+    assert _stream_state(task) == (1, 1, False)
+
+
+@pytest.mark.parametrize(
+    'skip_queue', (Project.SkipQueue.REQUEUE_FOR_ME, Project.SkipQueue.REQUEUE_FOR_OTHERS, Project.SkipQueue.IGNORE_SKIPPED)
+)
+@pytest.mark.django_db
+def test_next_task_with_stream_state(business_client, settings, skip_queue):
+    project = make_project(
+        dict(title='test_stream_state', is_published=True, maximum_annotations=2, skip_queue=skip_queue),
+        business_client.user,
+        use_ml_backend=False,
+    )
+    annotators = [make_annotator({'email': f'ann{i}@teststreamstate.com'}, project, True) for i in range(2)]
+    tasks = [make_task({'data': {'text': f'text {i}'}}, project) for i in range(3)]
+    # two tasks are skipped by other annotators, one of them is also finished
+    make_annotation({'result': [], 'completed_by': annotators[0].annotator, 'was_cancelled': True}, tasks[0].id)
+    make_annotation({'result': [], 'completed_by': annotators[0].annotator, 'was_cancelled': True}, tasks[1].id)
+    make_annotation({'result': [], 'completed_by': annotators[1].annotator}, tasks[1].id)
+
+    next_task_ids = []
+    for use_stream_state in (False, True):
+        settings.NEXT_TASK_USE_STREAM_STATE = use_stream_state
+        r = annotators[1].get(f'/api/projects/{project.id}/next')
+        assert r.status_code == 200
+        task_id = json.loads(r.content)['id']
+        next_task_ids.append(task_id)
+        Task.objects.get(id=task_id).release_lock()
+
+    assert next_task_ids[0] == next_task_ids[1]